@@ -30,6 +30,7 @@ with app.app_context():
     # Import models to ensure tables are created
     import models
     db.create_all()
+    models.upgrade_schema()
 
 # Import routes after app creation
 import routes
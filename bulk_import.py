@@ -0,0 +1,132 @@
+import os
+import io
+import csv
+import json
+from urllib.parse import urlparse
+from app import db
+from models import ProductMonitor
+from scraper import normalize_product_url
+from monitor_setup import PENDING_STATUS, queue_bulk_setup
+
+# Largest number of monitors accepted in one import
+MAX_IMPORT_ROWS = int(os.environ.get("MAX_IMPORT_ROWS", "1000"))
+
+CONDITION_FIELDS = ['check_stock', 'check_size', 'check_delivery', 'check_price']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on', 'x'}
+
+class ImportFileError(ValueError):
+    """Raised when an import can't be done at all: the file is unreadable or too large, or alerts have nowhere to go"""
+
+def parse_import_file(filename, data):
+    """
+    Read monitor rows from an uploaded CSV or JSON file
+    CSV files need a header row naming the columns (product_url, check_stock, check_size,
+    desired_size, check_delivery, check_price, target_price); JSON files hold a list of
+    objects with the same keys, or {"monitors": [...]}
+    Returns list of dicts
+    """
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ImportFileError("File must be UTF-8 encoded")
+
+    if filename.lower().endswith('.json') or text.lstrip().startswith(('[', '{')):
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise ImportFileError(f"Invalid JSON: {str(e)}")
+        if isinstance(rows, dict):
+            rows = rows.get('monitors')
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ImportFileError("JSON must be a list of monitor objects")
+        return rows
+
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'product_url' not in [name.strip() for name in reader.fieldnames]:
+        raise ImportFileError("CSV needs a header row with a product_url column")
+    return [{(key or '').strip(): (value or '').strip() for key, value in row.items()} for row in reader]
+
+def _is_true(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+def validate_row(row, defaults=None):
+    """
+    Turn one imported row into ProductMonitor column values
+    Conditions missing from the row are taken from defaults
+    Returns (values, None) or (None, error message)
+    """
+    row = dict(defaults or {}, **{key: value for key, value in row.items() if value not in (None, '')})
+    product_url = str(row.get('product_url') or '').strip()
+    if not product_url:
+        return None, "product_url is required"
+    if urlparse(product_url).scheme not in ('http', 'https') or not urlparse(product_url).netloc:
+        return None, f"Invalid URL: {product_url}"
+
+    values = {field: _is_true(row.get(field)) for field in CONDITION_FIELDS}
+    if not any(values.values()):
+        return None, "Select at least one monitoring condition"
+
+    values['desired_size'] = None
+    if values['check_size']:
+        values['desired_size'] = str(row.get('desired_size') or '').strip()[:20] or None
+        if not values['desired_size']:
+            return None, "desired_size is required when check_size is set"
+
+    values['target_price'] = None
+    if values['check_price']:
+        try:
+            values['target_price'] = float(row.get('target_price'))
+        except (TypeError, ValueError):
+            return None, "target_price must be a number when check_price is set"
+
+    values['product_url'] = product_url
+    return values, None
+
+def import_monitors(user, rows, defaults=None):
+    """
+    Validate and create monitors for many rows in one transaction
+    URLs the user is already watching (or that repeat within the import) are skipped;
+    the created monitors are scraped and started together in the background
+    Returns dict with created monitor ids, skipped duplicate URLs and per-row errors
+    """
+    if not (user.email or '').strip():
+        # Guest accounts start without one, and every alert is sent by email
+        raise ImportFileError("An email address is required for alerts; add one on the monitor form before importing")
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise ImportFileError(f"Too many rows: at most {MAX_IMPORT_ROWS} monitors can be imported at once")
+
+    watched = {
+        normalize_product_url(product_url) for product_url, in
+        db.session.query(ProductMonitor.product_url).filter_by(user_id=user.id, is_active=True)
+    }
+
+    monitors = []
+    duplicates = []
+    errors = []
+    for index, row in enumerate(rows, start=1):
+        values, error = validate_row(row, defaults)
+        if error:
+            errors.append({'row': index, 'error': error})
+            continue
+        key = normalize_product_url(values['product_url'])
+        if key in watched:
+            duplicates.append(values['product_url'])
+            continue
+        watched.add(key)
+        monitors.append(ProductMonitor(user_id=user.id, last_status=PENDING_STATUS, **values))
+
+    created = []
+    if monitors:
+        db.session.add_all(monitors)
+        db.session.flush()
+        created = [monitor.id for monitor in monitors]
+        db.session.commit()
+        queue_bulk_setup(created, user.email, user.phone_number, user.notification_preference)
+
+    return {
+        'created': created,
+        'duplicates': duplicates,
+        'errors': errors
+    }
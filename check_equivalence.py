@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Check optimized code paths against straightforward reference implementations
+
+    python check_equivalence.py extractor [PAGES_DIR]
+    python check_equivalence.py conditions [CASES]
+    python check_equivalence.py bench [MONITORS]
+    python check_equivalence.py prices [PRICES_FILE]
+
+PAGES_DIR is a directory of saved product pages (*.html, searched recursively);
+a few built-in sample pages are always checked as well. CASES is the number of
+random products evaluated against random monitors (default 2000). MONITORS is
+how many monitors of one product the bench check times through the scheduler's
+batches per-monitor, compiled per batch and with the cached index (default
+100000). PRICES_FILE
+holds one scraped price text per line, checked alongside the built-in samples.
+Prints every input whose output differs and exits with status 1 if any did;
+for prices only differences the samples don't list as intended count
+"""
+import re
+import sys
+import time
+import random
+from types import SimpleNamespace
+from pathlib import Path
+from bs4 import BeautifulSoup
+from extractor import (
+    AVAILABILITY_SELECTORS, DELIVERY_SELECTORS, NAME_SELECTORS, PRICE_SELECTORS, SIZE_SELECTORS,
+    OUT_OF_STOCK_INDICATORS, extract_product_fields
+)
+from prices import find_price, price_amount
+
+# Small pages covering each selector form the extractor compiles itself
+SAMPLE_PAGES = {
+    'testid title, sale price, sold out button': '''
+        <h1 data-testid="product-title">Trail Runner</h1>
+        <div class="pricing"><span class="was-price">Was $120.00</span><span class="sale-price">$89.99</span></div>
+        <button class="buy">Sold Out</button>
+        <div class="sizes"><button>8</button><button>9</button><button>9</button></div>
+        <p class="shipping-info">Free delivery in 3 days</p>''',
+    'nested name, option sizes, availability text': '''
+        <div class="product-name"><h1>Linen Shirt <small>Blue</small></h1></div>
+        <span class="product-price">£45</span>
+        <div class="stock-status">Currently unavailable in store</div>
+        <select class="size-selector"><option value="">Pick</option><option value="S">Small</option>
+        <option value="M">Medium</option></select>
+        <div data-testid="delivery">Delivery available</div>''',
+    'class substring price, descendant without match': '''
+        <div class="title"><span>Not a heading</span></div>
+        <h2 class="product-title">Desk Lamp</h2>
+        <div class="item-price-box">Only ₹1,299.00 today</div>
+        <input type="submit" value="Add to cart">
+        <span class="size-option">One size</span><span data-testid="size-option">One size</span>''',
+    'id title, no price, multi-class match': '''
+        <h1 id="product-title" class="x">Ceramic Mug</h1>
+        <div class="price sale">Call for price</div>
+        <div class="price-current">Now €12,50</div>
+        <div class="availability in-stock">In stock</div>
+        <ul><li class="size-variant big">XL</li><li class="size-variant">L</li></ul>''',
+    'nothing recognisable': '<p>Hello</p><button>Subscribe</button>'
+}
+
+def reference_fields(soup):
+    """The per-field select_one/select scans the single-pass extractor replaced"""
+    def first_text(selectors):
+        for selector in selectors:
+            element = soup.select_one(selector)
+            if element:
+                return element.get_text(strip=True)
+        return None
+
+    price = None
+    for selector in PRICE_SELECTORS:
+        element = soup.select_one(selector)
+        if element:
+            price = find_price(element.get_text(strip=True))
+            if price:
+                break
+
+    availability = 'In Stock'
+    texts = [button.get_text(strip=True).lower() for button in soup.find_all(['button', 'input'])]
+    for selector in AVAILABILITY_SELECTORS:
+        element = soup.select_one(selector)
+        if element:
+            texts.append(element.get_text(strip=True).lower())
+    if any(indicator in text for text in texts for indicator in OUT_OF_STOCK_INDICATORS):
+        availability = 'Out of Stock'
+
+    sizes = []
+    for selector in SIZE_SELECTORS:
+        for element in soup.select(selector):
+            if element.name == 'option' and element.get('value'):
+                size = element.get('value')
+            else:
+                size = element.get_text(strip=True)
+            if size and size not in sizes:
+                sizes.append(size)
+
+    return {
+        'name': first_text(NAME_SELECTORS),
+        'price': price,
+        'availability': availability,
+        'sizes': sizes,
+        'delivery': first_text(DELIVERY_SELECTORS) or 'Delivery info not found'
+    }
+
+def load_pages(pages_dir=None):
+    """Return list of (label, html) for the sample pages and any saved pages"""
+    pages = list(SAMPLE_PAGES.items())
+    if pages_dir:
+        for path in sorted(Path(pages_dir).rglob('*.html')):
+            pages.append((str(path), path.read_bytes()))
+    return pages
+
+def check_extractor(pages_dir=None):
+    """Compare extract_product_fields with the reference scans; returns the number of differing pages"""
+    pages = load_pages(pages_dir)
+    differing = 0
+    reference_time = extractor_time = 0.0
+    for label, html in pages:
+        soup = BeautifulSoup(html, 'html.parser')
+
+        started = time.perf_counter()
+        expected = reference_fields(soup)
+        reference_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual, _ = extract_product_fields(soup)
+        extractor_time += time.perf_counter() - started
+
+        if actual != expected:
+            differing += 1
+            print(f"DIFF {label}")
+            for field in expected:
+                if actual[field] != expected[field]:
+                    print(f"  {field}: expected {expected[field]!r}, got {actual[field]!r}")
+
+    print(f"extractor: {len(pages)} pages, {differing} differing; per page "
+          f"{reference_time / len(pages) * 1000:.2f} ms reference, "
+          f"{extractor_time / len(pages) * 1000:.2f} ms single pass")
+    return differing
+
+def random_monitors(rng, count):
+    """Monitors with random conditions; sizes and targets often tie to exercise the index edges"""
+    return [SimpleNamespace(
+        id=monitor_id,
+        check_stock=rng.random() < 0.5,
+        check_size=rng.random() < 0.5,
+        desired_size=rng.choice(['S', 'M', 'L', '9', '', None]),
+        check_delivery=rng.random() < 0.5,
+        check_price=rng.random() < 0.5,
+        target_price=rng.choice([None, 0, 9.99, 10, 10.0, 49.5, 100, rng.uniform(1, 200)])
+    ) for monitor_id in range(1, count + 1)]
+
+def random_product_info(rng):
+    return {
+        'name': 'Product',
+        'price': rng.choice(['$10', '$10.00', '£9.99', '49,50 €', '$1,299.00', 'Call for price', '',
+                             f"${rng.uniform(1, 200):.2f}"]),
+        'availability': rng.choice(['In Stock', 'Out of Stock']),
+        'sizes': rng.sample(['S', 'M', 'L', '9', 'S'], rng.randint(0, 4)),
+        'delivery': rng.choice(['Free delivery', 'Currently available', 'Collect in store', ''])
+    }
+
+def check_conditions(cases=2000):
+    """Compare evaluate_conditions with per-monitor check_product_conditions; returns the number of differing cases"""
+    # Imported here since scraper pulls in the app and its database
+    from conditions import evaluate_conditions
+    from scraper import check_product_conditions
+
+    rng = random.Random(0)
+    differing = 0
+    reference_time = compiled_time = 0.0
+    for case in range(int(cases)):
+        monitors = random_monitors(rng, rng.randint(1, 40))
+        product_info = random_product_info(rng)
+
+        started = time.perf_counter()
+        expected = {monitor.id: check_product_conditions(monitor, product_info) for monitor in monitors}
+        reference_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual = evaluate_conditions(monitors, product_info)
+        compiled_time += time.perf_counter() - started
+
+        if actual != expected:
+            differing += 1
+            print(f"DIFF case {case}: {product_info!r}")
+            for monitor in monitors:
+                if actual.get(monitor.id) != expected[monitor.id]:
+                    print(f"  monitor {vars(monitor)}: expected {expected[monitor.id]!r}, "
+                          f"got {actual.get(monitor.id)!r}")
+
+    print(f"conditions: {cases} cases, {differing} differing; per case "
+          f"{reference_time / int(cases) * 1000:.3f} ms per monitor, "
+          f"{compiled_time / int(cases) * 1000:.3f} ms compiled")
+    return differing
+
+def check_bench(count=100000):
+    """Time one product's monitors checked in scheduler batches; returns the number of differing results"""
+    # The app is loaded first; monitoring is only importable after it
+    import app  # noqa: F401
+    from conditions import evaluate_conditions, evaluate_product, forget_monitor_conditions
+    from monitoring import CHECK_BATCH_SIZE
+    from scraper import check_product_conditions
+
+    rng = random.Random(0)
+    monitors = random_monitors(rng, int(count))
+    batches = [monitors[i:i + CHECK_BATCH_SIZE] for i in range(0, len(monitors), CHECK_BATCH_SIZE)]
+    # The first round indexes the monitors, the second re-evaluates them after a
+    # change and the third checks them again with the product unchanged
+    changed = {'name': 'Product', 'price': '$49.50', 'availability': 'In Stock', 'sizes': ['S', 'M'],
+               'delivery': 'Free delivery'}
+    states = [
+        {'name': 'Product', 'price': '$120.00', 'availability': 'Out of Stock', 'sizes': [], 'delivery': ''},
+        changed,
+        changed
+    ]
+    ways = {
+        'per monitor': lambda batch, info: {m.id: check_product_conditions(m, info) for m in batch},
+        'compiled per batch': evaluate_conditions,
+        'cached index': lambda batch, info: evaluate_product('bench', batch, info)
+    }
+
+    forget_monitor_conditions()
+    differing = 0
+    for round_number, product_info in enumerate(states, 1):
+        expected = {}
+        for name, evaluate in ways.items():
+            started = time.perf_counter()
+            results = {}
+            for batch in batches:
+                results.update(evaluate(batch, product_info))
+            elapsed = time.perf_counter() - started
+            if not expected:
+                expected = results
+            elif results != expected:
+                differing += sum(results.get(key) != value for key, value in expected.items())
+            print(f"bench round {round_number}: {len(monitors)} monitors in {len(batches)} batches, "
+                  f"{name} {elapsed * 1000:.1f} ms")
+    forget_monitor_conditions()
+    print(f"bench: {differing} differing results")
+    return differing
+
+# Price texts with the amount the new parser is meant to read from them; the old
+# regexes got these wrong, so differing from them here is intended
+SAMPLE_PRICES = {
+    '$19.99': 19.99,
+    '£1,299.00': 1299.0,
+    'Only ₹1,299.00 today': 1299.0,
+    'Was $120.00 Now $89.99': 89.99,
+    'RRP £30 Save £5 £25': 25.0,
+    '€12,50': 12.5,
+    '12,50 €': 12.5,
+    '1.299,00 €': 1299.0,
+    '$10 - $20': 10.0,
+    'US$15.00': 15.0,
+    'CHF 49.90': 49.9,
+    'Size 10 $19': 19.0,
+    '¥1,200': 1200.0,
+    '₹1,29,999': 129999.0,
+    '₹10,00,000': 1000000.0,
+    '₹1,00,00,000.50': 10000000.5,
+    'Call for price': None
+}
+
+def reference_price(text):
+    """The old pipeline: currency regex on the element text, then the first number with commas dropped"""
+    price_match = re.search(r'[\$£€¥₹]\s*[\d,]+\.?\d*', text)
+    if not price_match:
+        return None
+    number = re.search(r'[\d,]+\.?\d*', price_match.group().replace(',', ''))
+    return float(number.group()) if number else None
+
+def current_price(text):
+    """The new pipeline: find_price on the element text, then price_amount"""
+    return price_amount(find_price(text))
+
+def check_prices(prices_file=None):
+    """Compare price parsing with the old regexes; returns the number of unintended differences"""
+    texts = list(SAMPLE_PRICES)
+    if prices_file:
+        texts += [line.strip() for line in Path(prices_file).read_text().splitlines() if line.strip()]
+
+    intended = unintended = 0
+    reference_time = parser_time = 0.0
+    for text in dict.fromkeys(texts):
+        started = time.perf_counter()
+        expected = reference_price(text)
+        reference_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual = current_price(text)
+        parser_time += time.perf_counter() - started
+
+        if actual == expected:
+            continue
+        if text in SAMPLE_PRICES and actual == SAMPLE_PRICES[text]:
+            intended += 1
+            print(f"CHANGED {text!r}: {expected!r} -> {actual!r}")
+        else:
+            unintended += 1
+            print(f"DIFF {text!r}: expected {expected!r}, got {actual!r}")
+
+    print(f"prices: {len(texts)} texts, {intended} intended and {unintended} unintended differences; "
+          f"{reference_time * 1000:.2f} ms reference, {parser_time * 1000:.2f} ms parser")
+    return unintended
+
+CHECKS = {
+    'extractor': check_extractor,
+    'conditions': check_conditions,
+    'bench': check_bench,
+    'prices': check_prices
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in CHECKS:
+        sys.exit(f"usage: python check_equivalence.py {{{'|'.join(CHECKS)}}} [ARG]")
+    sys.exit(1 if CHECKS[sys.argv[1]](*sys.argv[2:3]) else 0)
@@ -0,0 +1,172 @@
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from prices import price_amount
+
+NOT_MET = (False, "Conditions not yet met")
+
+class CompiledConditions:
+    """
+    Conditions of many monitors of one product, indexed by what each condition tests
+    so one product_info can be evaluated against all of them at once. Monitors can
+    be added and removed without rebuilding the index
+    """
+
+    def __init__(self, monitors=()):
+        self.conditions = {}  # monitor_id -> (check_stock, check_size, desired_size, check_delivery, check_price, target_price)
+        self.stock_ids = set()
+        self.delivery_ids = set()
+        self.size_ids = defaultdict(set)  # Desired size -> monitors waiting for it
+        # (target price, monitor_id) sorted ascending, so every target at or above the
+        # current price is a contiguous tail found with one bisection
+        self.targets = []
+        for monitor in monitors:
+            self.add(monitor)
+
+    def add(self, monitor):
+        """Index a monitor's conditions, replacing any it was indexed with before"""
+        if monitor.id in self.conditions:
+            self.remove(monitor.id)
+        check_stock, check_size, desired_size = monitor.check_stock, monitor.check_size, monitor.desired_size
+        check_price, target_price = monitor.check_price, monitor.target_price
+        self.conditions[monitor.id] = (check_stock, check_size, desired_size, monitor.check_delivery,
+                                       check_price, target_price)
+        if check_stock:
+            self.stock_ids.add(monitor.id)
+        if check_size and desired_size:
+            self.size_ids[desired_size].add(monitor.id)
+        if monitor.check_delivery:
+            self.delivery_ids.add(monitor.id)
+        if check_price and target_price:
+            insort(self.targets, (target_price, monitor.id))
+
+    def remove(self, monitor_id):
+        """Drop a monitor from the index"""
+        conditions = self.conditions.pop(monitor_id, None)
+        if conditions is None:
+            return
+        _, check_size, desired_size, _, check_price, target_price = conditions
+        self.stock_ids.discard(monitor_id)
+        self.delivery_ids.discard(monitor_id)
+        if check_size and desired_size:
+            self.size_ids[desired_size].discard(monitor_id)
+            if not self.size_ids[desired_size]:
+                del self.size_ids[desired_size]
+        if check_price and target_price:
+            index = bisect_left(self.targets, (target_price, monitor_id))
+            del self.targets[index]
+
+    def matches(self, product_info):
+        """Returns dict of monitor_id -> messages of the conditions it met, for monitors that met any"""
+        notifications = defaultdict(list)
+
+        # Check stock
+        if product_info['availability'] == 'In Stock':
+            for monitor_id in self.stock_ids:
+                notifications[monitor_id].append("✅ Product is now in stock!")
+
+        # Check size availability
+        for size in dict.fromkeys(product_info.get('sizes', [])):
+            for monitor_id in self.size_ids.get(size, ()):
+                notifications[monitor_id].append(f"✅ Size {size} is available!")
+
+        # Check delivery (basic check)
+        delivery_text = product_info.get('delivery', '').lower()
+        if 'available' in delivery_text or 'delivery' in delivery_text:
+            for monitor_id in self.delivery_ids:
+                notifications[monitor_id].append("✅ Delivery is available!")
+
+        # Check price
+        price_text = product_info.get('price', '')
+        current_price = price_amount(price_text)
+        if current_price:
+            for target, monitor_id in self.targets[bisect_left(self.targets, (current_price,)):]:
+                notifications[monitor_id].append(f"✅ Price dropped to {price_text} (target: ${target})")
+        return dict(notifications)
+
+    def evaluate(self, product_info):
+        """
+        Evaluate every monitor against one product_info
+        Returns dict of monitor_id -> (should_notify, message), matching check_product_conditions
+        """
+        results = dict.fromkeys(self.conditions, NOT_MET)
+        header = _header(product_info)
+        for monitor_id, found in self.matches(product_info).items():
+            results[monitor_id] = (True, header + "\n".join(found))
+        return results
+
+def _header(product_info):
+    return f"Good news about {product_info['name']}!\n\n"
+
+def evaluate_conditions(monitors, product_info):
+    """Evaluate many monitors of the same product in one pass; see CompiledConditions.evaluate"""
+    return CompiledConditions(monitors).evaluate(product_info)
+
+# Per product (normalized URL): its compiled conditions and which of them the product
+# state they were last evaluated against met, shared by every check batch of the product
+_products = {}  # key -> {'compiled', 'state', 'header', 'matches'}
+_monitor_products = {}  # monitor_id -> key
+_products_lock = threading.Lock()
+
+def _evaluated_state(product_info):
+    """The product fields condition results depend on"""
+    return (product_info.get('name'), product_info.get('availability'), tuple(product_info.get('sizes') or ()),
+            product_info.get('delivery'), product_info.get('price'))
+
+def evaluate_product(key, monitors, product_info):
+    """
+    Evaluate monitors of the product stored under key against product_info
+    The product's compiled conditions are kept between checks and grow as its monitors
+    come up; all of them are matched together once per product state and later batches
+    of the same state only look their monitors up. A monitor's conditions can't be
+    edited, so it's indexed once until forget_monitor_conditions drops it
+    Returns dict of monitor_id -> (should_notify, message) for monitors
+    """
+    state = _evaluated_state(product_info)
+    with _products_lock:
+        product = _products.get(key)
+        if product is None:
+            product = _products[key] = {'compiled': CompiledConditions(), 'state': None}
+        compiled = product['compiled']
+        added = [monitor for monitor in monitors if monitor.id not in compiled.conditions]
+        for monitor in added:
+            if _monitor_products.get(monitor.id) is not None:
+                _forget_monitor(monitor.id)
+            _monitor_products[monitor.id] = key
+            compiled.add(monitor)
+
+        if product['state'] != state:
+            product['state'] = state
+            product['header'] = _header(product_info)
+            product['matches'] = compiled.matches(product_info)
+        elif added:
+            # Same state: only the newly indexed monitors need matching
+            product['matches'].update(CompiledConditions(added).matches(product_info))
+        header, matches = product['header'], product['matches']
+
+    results = {}
+    for monitor in monitors:
+        found = matches.get(monitor.id)
+        results[monitor.id] = (True, header + "\n".join(found)) if found else NOT_MET
+    return results
+
+def _forget_monitor(monitor_id):
+    """Drop a monitor from its product's index (caller holds _products_lock)"""
+    key = _monitor_products.pop(monitor_id, None)
+    product = _products.get(key)
+    if product is None:
+        return
+    product['compiled'].remove(monitor_id)
+    product.get('matches', {}).pop(monitor_id, None)
+    if not product['compiled'].conditions:
+        del _products[key]
+
+def forget_monitor_conditions(monitor_ids=None):
+    """Drop stopped or released monitors from their products' indexes (all of them without monitor_ids)"""
+    with _products_lock:
+        if monitor_ids is None:
+            _products.clear()
+            _monitor_products.clear()
+            return
+        for monitor_id in monitor_ids:
+            _forget_monitor(monitor_id)
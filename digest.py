@@ -0,0 +1,110 @@
+import os
+import time
+import threading
+import logging
+from dispatch import queue_notification, resume_monitors
+from notifications import whatsapp_configured
+
+# Alerts for the same user within this many seconds are sent as one digest (0 disables)
+DIGEST_WINDOW = float(os.environ.get("NOTIFICATION_DIGEST_WINDOW", "60"))
+
+_pending_digests = {}  # user_id -> digest dict, see queue_alert
+_digest_cond = threading.Condition()
+_digest_thread = None
+_digest_stats = {'alerts': 0, 'messages': 0}
+
+def queue_alert(user, monitor, message):
+    """
+    Queue a triggered monitor's alert for its user
+    Alerts are held for DIGEST_WINDOW seconds after a user's first pending alert and
+    then sent together; every alert is still recorded as its own Notification row
+    """
+    alert = (monitor.id, monitor.product_name, message)
+    with _digest_cond:
+        _digest_stats['alerts'] += 1
+        digest = _pending_digests.get(user.id)
+        if digest is None:
+            digest = _pending_digests[user.id] = {
+                'email': user.email,
+                'phone_number': (user.phone_number if user.notification_preference == 'email_whatsapp'
+                                 and whatsapp_configured() else None),
+                'alerts': [],
+                'due': time.monotonic() + DIGEST_WINDOW
+            }
+        digest['alerts'].append(alert)
+        _ensure_digest_thread_running()
+        _digest_cond.notify()
+    return True
+
+def build_digest(alerts):
+    """Build (subject, message) for a list of (monitor_id, product_name, message) alerts"""
+    if len(alerts) == 1:
+        _, product_name, message = alerts[0]
+        return f"Product Alert: {product_name}", message
+
+    sections = [f"{index}. {message}" for index, (_, _, message) in enumerate(alerts, 1)]
+    message = f"{len(alerts)} of your monitored products have updates:\n\n" + "\n\n".join(sections)
+    return f"Product Alerts: {len(alerts)} products", message
+
+def _send_digest(digest):
+    """Hand one user's digest to the dispatch queue"""
+    alerts = digest['alerts']
+    subject, message = build_digest(alerts)
+    records = [(monitor_id, alert_message) for monitor_id, _, alert_message in alerts]
+
+    # Email delivery is what stops the monitors, as it was before digests
+    queue_notification('email', digest['email'], message, subject=subject, alerts=records, deactivate=True)
+    digest['email_queued'] = True
+    messages = 1
+    if digest['phone_number']:
+        queue_notification('whatsapp', digest['phone_number'], message, alerts=records)
+        messages += 1
+
+    with _digest_cond:
+        _digest_stats['messages'] += messages
+    if len(alerts) > 1:
+        logging.info(f"Sent digest of {len(alerts)} alerts to {digest['email']}")
+
+def _send_digests(digests):
+    for digest in digests:
+        try:
+            _send_digest(digest)
+        except Exception as e:
+            logging.error(f"Failed to send digest to {digest['email']}: {str(e)}")
+            if not digest.get('email_queued'):
+                # Nothing will deliver these alerts or stop the monitors; check them again instead
+                resume_monitors([monitor_id for monitor_id, _, _ in digest['alerts']])
+
+def _digest_loop():
+    """Send each user's digest once its window has closed"""
+    while True:
+        with _digest_cond:
+            now = time.monotonic()
+            due = [user_id for user_id, digest in _pending_digests.items() if digest['due'] <= now]
+            ready = [_pending_digests.pop(user_id) for user_id in due]
+            if not ready:
+                next_due = min((digest['due'] for digest in _pending_digests.values()), default=None)
+                _digest_cond.wait(None if next_due is None else next_due - now)
+                continue
+
+        _send_digests(ready)
+
+def flush_digests():
+    """Send every pending digest now, without waiting for its window; returns how many were sent"""
+    with _digest_cond:
+        ready = list(_pending_digests.values())
+        _pending_digests.clear()
+    _send_digests(ready)
+    return len(ready)
+
+def _ensure_digest_thread_running():
+    """Start the digest thread on first use (caller holds _digest_cond)"""
+    global _digest_thread
+    if _digest_thread is None or not _digest_thread.is_alive():
+        _digest_thread = threading.Thread(target=_digest_loop, name='notification-digest', daemon=True)
+        _digest_thread.start()
+
+def get_digest_stats():
+    """Return alert and outgoing message counts"""
+    with _digest_cond:
+        return dict(_digest_stats)
@@ -0,0 +1,200 @@
+import os
+import time
+import queue
+import threading
+import logging
+from app import app, db
+from models import Notification, ProductMonitor
+from notifications import (
+    SMTP_USERNAME, build_email_message, open_smtp_connection,
+    deliver_whatsapp, is_whatsapp_permanent_error, log_whatsapp_failure
+)
+
+# Notification dispatch configuration
+NOTIFICATION_WORKERS = int(os.environ.get("NOTIFICATION_WORKERS", "4"))  # Concurrent senders across all channels
+MAX_SEND_ATTEMPTS = 3
+RETRY_BACKOFF = 2  # Seconds before the first retry, doubled for each further attempt
+SMTP_IDLE_TIMEOUT = 60  # Pooled SMTP sessions idle longer than this are checked with NOOP
+RECORD_FLUSH_INTERVAL = 2  # Seconds between writes of buffered Notification rows
+RECORD_BATCH_SIZE = 50
+DRAIN_TIMEOUT = 60  # Seconds a stopping process waits for queued notifications to go out
+
+_notification_queue = queue.Queue()
+_workers = []
+_workers_lock = threading.Lock()
+
+def queue_notification(channel, recipient, message, subject=None, monitor_id=None, alerts=None, deactivate=False):
+    """
+    Queue a notification for background delivery
+    channel is a key of CHANNEL_SENDERS. A Notification row is recorded for the
+    outcome when monitor_id is given, or one row per (monitor_id, message) pair in
+    alerts when one message covers several monitors. With deactivate the alerts'
+    monitors are stopped, in the same transaction as their rows, once the message
+    is delivered; if delivery fails they are handed back to monitoring instead.
+    Returns True once queued
+    """
+    if alerts is None:
+        alerts = [(monitor_id, message)] if monitor_id else []
+    if channel not in CHANNEL_SENDERS:
+        logging.error(f"Unknown notification channel: {channel}")
+        return False
+    _ensure_workers_running()
+    _notification_queue.put({
+        'channel': channel,
+        'recipient': recipient,
+        'message': message,
+        'subject': subject,
+        'alerts': alerts,
+        'deactivate': deactivate
+    })
+    return True
+
+def _send_email(item, state):
+    """Send an email over the worker's pooled SMTP session, reconnecting when needed"""
+    server = state.get('smtp')
+    if server is not None and time.monotonic() - state.get('smtp_used', 0) > SMTP_IDLE_TIMEOUT:
+        try:
+            server.noop()
+        except Exception:
+            _close_smtp(state)
+            server = None
+    if server is None:
+        server = state['smtp'] = open_smtp_connection()
+
+    msg = build_email_message(item['recipient'], item['subject'], item['message'])
+    server.sendmail(SMTP_USERNAME, item['recipient'], msg.as_string())
+    state['smtp_used'] = time.monotonic()
+    logging.info(f"Email sent successfully to {item['recipient']}")
+
+def _close_smtp(state):
+    server = state.pop('smtp', None)
+    if server is not None:
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+def _send_whatsapp(item, state):
+    """Send a WhatsApp message over the shared Twilio client"""
+    deliver_whatsapp(item['recipient'], item['message'])
+
+def _no_reset(state):
+    pass
+
+def _never_permanent(error):
+    return False
+
+def _whatsapp_permanent(error):
+    if is_whatsapp_permanent_error(error):
+        log_whatsapp_failure(error)
+        return True
+    return False
+
+# channel -> (send, reset session after an error, error is not worth retrying)
+CHANNEL_SENDERS = {
+    'email': (_send_email, _close_smtp, _never_permanent),
+    'whatsapp': (_send_whatsapp, _no_reset, _whatsapp_permanent)
+}
+
+def _deliver(item, state):
+    """Deliver one notification, retrying with exponential backoff; returns success"""
+    send, reset, is_permanent = CHANNEL_SENDERS[item['channel']]
+    for attempt in range(MAX_SEND_ATTEMPTS):
+        try:
+            send(item, state)
+            return True
+        except Exception as e:
+            logging.warning(f"{item['channel']} notification to {item['recipient']} failed "
+                            f"(attempt {attempt + 1}/{MAX_SEND_ATTEMPTS}): {str(e)}")
+            if is_permanent(e):
+                break
+            # Drop the session; it may be the thing that broke
+            reset(state)
+            if attempt + 1 < MAX_SEND_ATTEMPTS:
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+    logging.error(f"Giving up on {item['channel']} notification to {item['recipient']}")
+    return False
+
+def _record_notifications(records, deactivations):
+    """Write a batch of Notification rows and stop the monitors whose alerts were delivered; returns success"""
+    try:
+        with app.app_context():
+            db.session.add_all(Notification(**record) for record in records)
+            if deactivations:
+                (ProductMonitor.query.filter(ProductMonitor.id.in_(deactivations))
+                 .update({'is_active': False}, synchronize_session=False))
+            db.session.commit()
+            db.session.remove()
+        return True
+    except Exception as e:
+        logging.error(f"Failed to record {len(records)} notifications: {str(e)}")
+        return False
+
+def resume_monitors(monitor_ids):
+    """Hand monitors whose alert wasn't delivered back to monitoring"""
+    from monitoring import resume_monitor
+
+    for monitor_id in monitor_ids:
+        resume_monitor(monitor_id)
+
+def _notification_worker():
+    """Deliver queued notifications, keeping a pooled session per channel"""
+    state = {}
+    records = []
+    deactivations = set()
+    last_flush = time.monotonic()
+    while True:
+        try:
+            item = _notification_queue.get(timeout=RECORD_FLUSH_INTERVAL)
+        except queue.Empty:
+            item = None
+
+        if item is not None:
+            success = _deliver(item, state)
+            for monitor_id, alert_message in item['alerts']:
+                records.append({
+                    'monitor_id': monitor_id,
+                    'notification_type': item['channel'],
+                    'message': alert_message,
+                    'status': 'sent' if success else 'failed'
+                })
+            if item['deactivate']:
+                monitor_ids = [monitor_id for monitor_id, _ in item['alerts']]
+                if success:
+                    deactivations.update(monitor_ids)
+                else:
+                    resume_monitors(monitor_ids)
+
+        # Rows are written before the item counts as done, so a drained queue is also recorded
+        if records and (item is None or _notification_queue.empty() or len(records) >= RECORD_BATCH_SIZE
+                        or time.monotonic() - last_flush >= RECORD_FLUSH_INTERVAL):
+            # Failed writes are kept and retried with the next batch
+            if _record_notifications(records, deactivations):
+                records = []
+                deactivations = set()
+            last_flush = time.monotonic()
+        if item is not None:
+            _notification_queue.task_done()
+
+def drain_notifications(timeout=DRAIN_TIMEOUT):
+    """
+    Wait until every queued notification has been delivered (or given up on) and recorded
+    Returns False if some were still pending after timeout seconds
+    """
+    deadline = time.monotonic() + timeout
+    with _notification_queue.all_tasks_done:
+        while _notification_queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logging.warning(f"{_notification_queue.unfinished_tasks} notifications still pending after {timeout}s")
+                return False
+            _notification_queue.all_tasks_done.wait(remaining)
+    return True
+
+def _ensure_workers_running():
+    with _workers_lock:
+        _workers[:] = [worker for worker in _workers if worker.is_alive()]
+        while len(_workers) < NOTIFICATION_WORKERS:
+            worker = threading.Thread(target=_notification_worker, name='notification-worker', daemon=True)
+            worker.start()
+            _workers.append(worker)
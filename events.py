@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import queue
+import threading
+import logging
+from datetime import datetime, timedelta
+
+# Live update stream configuration
+SUBSCRIBER_QUEUE_SIZE = 100  # Events buffered per connection before a slow client starts missing some
+KEEPALIVE_INTERVAL = int(os.environ.get("EVENTS_KEEPALIVE_INTERVAL", "15"))
+RELAY_INTERVAL = float(os.environ.get("EVENTS_RELAY_INTERVAL", "2"))
+EVENT_RETENTION = 3600  # Seconds stored events are kept; relays only read the most recent ones
+
+_subscribers = {}  # user_id -> set of queues, one per open /events connection
+_subscribers_lock = threading.Lock()
+_relay_thread = None
+
+def subscribe(user_id):
+    """Register a connection for a user's events; returns the queue they arrive on"""
+    events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _subscribers_lock:
+        _subscribers.setdefault(user_id, set()).add(events)
+    return events
+
+def unsubscribe(user_id, events):
+    """Drop a connection's queue"""
+    with _subscribers_lock:
+        connections = _subscribers.get(user_id)
+        if connections is not None:
+            connections.discard(events)
+            if not connections:
+                del _subscribers[user_id]
+
+def has_subscribers(user_id=None):
+    """Check whether a user (or, without user_id, anyone) has an open connection"""
+    with _subscribers_lock:
+        return user_id in _subscribers if user_id is not None else bool(_subscribers)
+
+def publish(user_id, event, data):
+    """Send an event to every open connection of a user; full queues drop the event"""
+    with _subscribers_lock:
+        connections = list(_subscribers.get(user_id, ()))
+    for events in connections:
+        try:
+            events.put_nowait((event, data))
+        except queue.Full:
+            logging.debug(f"Dropped {event} event for a slow connection of user {user_id}")
+
+def record_event(user_id, event, data):
+    """
+    Store an event for a user; the status relay of every web process publishes it to
+    the connections it serves. Must be called inside an app context
+    Returns True once stored
+    """
+    from app import db
+    from models import UserEvent
+
+    try:
+        db.session.add(UserEvent(user_id=user_id, event=event, data=json.dumps(data)))
+        (UserEvent.query.filter(UserEvent.created_at < datetime.utcnow() - timedelta(seconds=EVENT_RETENTION))
+         .delete(synchronize_session=False))
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to store {event} event for user {user_id}: {str(e)}")
+        return False
+
+def monitor_status(monitor_id, is_active, last_checked, last_status, product_price, product_name=None):
+    """Status fields of a monitor as sent to the dashboard (same shape as /api/monitors/status)"""
+    return {
+        'id': monitor_id,
+        'is_active': is_active,
+        'last_checked': last_checked.isoformat() if last_checked else None,
+        'last_status': last_status,
+        'product_price': product_price,
+        'product_name': product_name
+    }
+
+def event_stream(user_id):
+    """
+    Generate a Server-Sent Events stream of a user's events
+    Idle connections only wake up for a keepalive comment every KEEPALIVE_INTERVAL
+    """
+    events = subscribe(user_id)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                event, data = events.get(timeout=KEEPALIVE_INTERVAL)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    finally:
+        unsubscribe(user_id, events)
+
+def _relay_loop():
+    """Publish status changes, sent alerts and stored events that any process wrote to the database"""
+    from app import app, db
+    from models import Notification, ProductMonitor, UserEvent
+    from results import RESULT_WRITE_LAG
+
+    lag = timedelta(seconds=RESULT_WRITE_LAG)
+    published = {}  # monitor_id -> updated_at already published
+    notified = {}  # notification id -> sent_at already published
+    alerts = {}  # (monitor_id, message) -> sent_at, so an alert sent on two channels shows once
+    relayed = {}  # stored event id -> created_at already published
+    watermark = datetime.utcnow()
+    while True:
+        time.sleep(RELAY_INTERVAL)
+        started = datetime.utcnow()
+        if not has_subscribers():
+            # Nobody is listening; connections opened later start from here
+            watermark = started
+            continue
+        try:
+            with app.app_context():
+                rows = (db.session.query(ProductMonitor.id, ProductMonitor.updated_at, ProductMonitor.user_id,
+                                         ProductMonitor.is_active, ProductMonitor.last_checked,
+                                         ProductMonitor.last_status, ProductMonitor.product_price,
+                                         ProductMonitor.product_name)
+                        .filter(ProductMonitor.updated_at > watermark - lag)
+                        .all())
+                sent = (db.session.query(Notification.id, Notification.sent_at, Notification.monitor_id,
+                                         Notification.message, ProductMonitor.user_id)
+                        .join(ProductMonitor, ProductMonitor.id == Notification.monitor_id)
+                        .filter(Notification.status == 'sent', Notification.sent_at > watermark - lag)
+                        .order_by(Notification.sent_at, Notification.id)
+                        .all())
+                stored = (db.session.query(UserEvent.id, UserEvent.created_at, UserEvent.user_id,
+                                           UserEvent.event, UserEvent.data)
+                          .filter(UserEvent.created_at > watermark - lag)
+                          .order_by(UserEvent.created_at, UserEvent.id)
+                          .all())
+                db.session.remove()
+        except Exception as e:
+            logging.error(f"Failed to read monitor status changes: {str(e)}")
+            continue
+
+        for monitor_id, updated_at, user_id, is_active, last_checked, last_status, product_price, product_name in rows:
+            if published.get(monitor_id) == updated_at:
+                continue
+            published[monitor_id] = updated_at
+            if has_subscribers(user_id):
+                publish(user_id, 'status', monitor_status(monitor_id, is_active, last_checked,
+                                                          last_status, product_price, product_name))
+        for notification_id, sent_at, monitor_id, message, user_id in sent:
+            if notification_id in notified:
+                continue
+            notified[notification_id] = sent_at
+            if (monitor_id, message) in alerts:
+                continue
+            alerts[(monitor_id, message)] = sent_at
+            if has_subscribers(user_id):
+                publish(user_id, 'notification', {'id': monitor_id, 'message': message})
+        for event_id, created_at, user_id, event, data in stored:
+            if event_id in relayed:
+                continue
+            relayed[event_id] = created_at
+            if has_subscribers(user_id):
+                publish(user_id, event, json.loads(data))
+        watermark = started
+        published = {monitor_id: updated for monitor_id, updated in published.items() if updated > watermark - lag}
+        notified = {key: sent_at for key, sent_at in notified.items() if sent_at > watermark - lag}
+        alerts = {key: sent_at for key, sent_at in alerts.items() if sent_at > watermark - lag}
+        relayed = {key: created_at for key, created_at in relayed.items() if created_at > watermark - lag}
+
+def start_status_relay():
+    """
+    Start relaying status changes, sent alerts and stored events from the database to this process's subscribers
+    Every web process runs one: checks run in whichever process holds a monitor's
+    lease, whose events can't reach connections served by another process
+    """
+    global _relay_thread
+    if _relay_thread is None or not _relay_thread.is_alive():
+        _relay_thread = threading.Thread(target=_relay_loop, name='status-relay', daemon=True)
+        _relay_thread.start()
@@ -0,0 +1,308 @@
+import re
+from functools import lru_cache
+from bs4 import BeautifulSoup, Tag
+from prices import find_price
+
+# Candidate selectors per field, in priority order
+NAME_SELECTORS = [
+    'h1[data-testid="product-title"]',
+    'h1.product-title',
+    'h1#product-title',
+    '.product-name h1',
+    '.product-title',
+    'h1',
+    '.title h1',
+    '[data-cy="product-name"]'
+]
+
+PRICE_SELECTORS = [
+    '.price',
+    '.product-price',
+    '[data-testid="price"]',
+    '.current-price',
+    '.sale-price',
+    '.regular-price',
+    '.price-current',
+    '[class*="price"]'
+]
+
+AVAILABILITY_SELECTORS = [
+    '.availability',
+    '.stock-status',
+    '.product-availability',
+    '[data-testid="availability"]'
+]
+
+SIZE_SELECTORS = [
+    '.size-option',
+    '.size-selector option',
+    '.sizes button',
+    '[data-testid="size-option"]',
+    '.size-variant'
+]
+
+DELIVERY_SELECTORS = [
+    '.delivery-info',
+    '.shipping-info',
+    '.delivery-options',
+    '[data-testid="delivery"]'
+]
+
+FIELD_SELECTORS = {
+    'name': NAME_SELECTORS,
+    'price': PRICE_SELECTORS,
+    'availability': AVAILABILITY_SELECTORS,
+    'sizes': SIZE_SELECTORS,
+    'delivery': DELIVERY_SELECTORS
+}
+
+# Fields that use every match of a selector rather than just the first one
+MULTI_MATCH_FIELDS = {'sizes'}
+
+# Buttons and inputs are scanned for out of stock wording as well
+STOCK_CONTROL_TAGS = {'button', 'input'}
+
+OUT_OF_STOCK_INDICATORS = [
+    'out of stock',
+    'sold out',
+    'not available',
+    'unavailable',
+    'temporarily out of stock',
+    'currently unavailable'
+]
+OUT_OF_STOCK_PATTERN = re.compile('|'.join(re.escape(indicator) for indicator in OUT_OF_STOCK_INDICATORS))
+
+_COMPOUND_PATTERN = re.compile(r'^([a-zA-Z][a-zA-Z0-9]*)?((?:\.[\w-]+|#[\w-]+|\[[\w-]+\*?="[^"]*"\])*)$')
+_PART_PATTERN = re.compile(r'\.([\w-]+)|#([\w-]+)|\[([\w-]+)(\*?=)"([^"]*)"\]')
+
+def compile_selector(selector):
+    """
+    Compile a simple CSS selector into a list of compound selectors
+    Supports tag, .class, #id, [attr="value"], [attr*="value"] and the descendant combinator
+    Each compound is a tuple of (tag name, classes, id, attribute tests)
+    """
+    compounds = []
+    for part in selector.split():
+        match = _COMPOUND_PATTERN.match(part)
+        if not match:
+            raise ValueError(f"Unsupported selector: {selector}")
+        classes = set()
+        element_id = None
+        attribute_tests = []
+        for class_name, id_name, attr, operator, value in _PART_PATTERN.findall(match.group(2)):
+            if class_name:
+                classes.add(class_name)
+            elif id_name:
+                element_id = id_name
+            else:
+                attribute_tests.append((attr.lower(), operator, value))
+        compounds.append(((match.group(1) or '').lower() or None, classes, element_id, attribute_tests))
+    return compounds
+
+def _matches_compound(compound, tag):
+    """Check a single tag against one compound selector"""
+    name, classes, element_id, attribute_tests = compound
+    if name and tag.name != name:
+        return False
+    if classes and not classes.issubset(tag.get('class') or ()):
+        return False
+    if element_id and tag.get('id') != element_id:
+        return False
+    for attr, operator, value in attribute_tests:
+        actual = tag.get(attr)
+        if actual is None:
+            return False
+        if isinstance(actual, list):
+            actual = ' '.join(actual)
+        if operator == '=' and actual != value:
+            return False
+        if operator == '*=' and (not value or value not in actual):
+            return False
+    return True
+
+def _matches_selector(compounds, tag, ancestors):
+    """Check a tag against a compiled selector, walking the ancestor chain for descendant combinators"""
+    if not _matches_compound(compounds[-1], tag):
+        return False
+    position = len(ancestors)
+    for compound in reversed(compounds[:-1]):
+        position -= 1
+        while position >= 0 and not _matches_compound(compound, ancestors[position]):
+            position -= 1
+        if position < 0:
+            return False
+    return True
+
+@lru_cache(maxsize=1024)
+def _compiled_selector(selector):
+    return compile_selector(selector)
+
+@lru_cache(maxsize=256)
+def _selector_index(plan):
+    """
+    Index a plan of (field, selectors) pairs by the tag name each selector requires
+    Returns (by_tag, any_tag) lists of (field, selector position, compounds) entries
+    """
+    by_tag = {}
+    any_tag = []
+    for field, selectors in plan:
+        for index, selector in enumerate(selectors):
+            compounds = _compiled_selector(selector)
+            entry = (field, index, compounds)
+            if compounds[-1][0]:
+                by_tag.setdefault(compounds[-1][0], []).append(entry)
+            else:
+                any_tag.append(entry)
+    return by_tag, any_tag
+
+def _walk_tags(soup):
+    """Yield (tag, ancestors) for every tag in document order"""
+    ancestors = []
+    for node in soup.descendants:
+        if not isinstance(node, Tag):
+            continue
+        parent = node.parent
+        while ancestors and ancestors[-1] is not parent:
+            ancestors.pop()
+        yield node, ancestors
+        ancestors.append(node)
+
+def collect_selector_matches(soup, field_selectors=None):
+    """
+    Walk the document once and record what every candidate selector matches
+    field_selectors maps field -> selectors to try (default: FIELD_SELECTORS)
+    Returns (matches, stock_controls) where matches maps field -> one entry per
+    selector (the first matching tag, or a list of all matches for multi-match
+    fields) and stock_controls lists buttons and inputs in document order
+    """
+    field_selectors = FIELD_SELECTORS if field_selectors is None else field_selectors
+    by_tag, any_tag = _selector_index(tuple((field, tuple(selectors)) for field, selectors in field_selectors.items()))
+    matches = {
+        field: [[] if field in MULTI_MATCH_FIELDS else None for _ in selectors]
+        for field, selectors in field_selectors.items()
+    }
+    stock_controls = []
+
+    for tag, ancestors in _walk_tags(soup):
+        if tag.name in STOCK_CONTROL_TAGS:
+            stock_controls.append(tag)
+        for entries in (by_tag.get(tag.name, ()), any_tag):
+            for field, index, compounds in entries:
+                field_matches = matches[field]
+                if field in MULTI_MATCH_FIELDS:
+                    if _matches_selector(compounds, tag, ancestors):
+                        field_matches[index].append(tag)
+                elif field_matches[index] is None and _matches_selector(compounds, tag, ancestors):
+                    field_matches[index] = tag
+
+    return matches, stock_controls
+
+def is_out_of_stock_text(text):
+    """Check text for any out of stock wording"""
+    return OUT_OF_STOCK_PATTERN.search(text.lower()) is not None
+
+# Each resolver takes the selectors tried and what they matched, and returns
+# (value, selectors that produced the value)
+
+def resolve_name(selectors, candidates):
+    """Pick the product name from the first selector that matched"""
+    for selector, element in zip(selectors, candidates):
+        if element is not None:
+            return element.get_text(strip=True), [selector]
+    return None, []
+
+def resolve_price(selectors, candidates):
+    """Pick the first candidate whose text contains a price"""
+    for selector, element in zip(selectors, candidates):
+        if element is not None:
+            price = find_price(element.get_text(strip=True))
+            if price:
+                return price, [selector]
+    return None, []
+
+def resolve_availability(selectors, candidates, stock_controls):
+    """Decide stock status from buttons/inputs and availability messages"""
+    for element in stock_controls:
+        if is_out_of_stock_text(element.get_text(strip=True)):
+            return 'Out of Stock', []
+    used = []
+    for selector, element in zip(selectors, candidates):
+        if element is not None:
+            used.append(selector)
+            if is_out_of_stock_text(element.get_text(strip=True)):
+                return 'Out of Stock', used
+    return 'In Stock', used
+
+def resolve_sizes(selectors, candidates):
+    """Collect unique sizes from every matching size element"""
+    sizes = []
+    used = []
+    for selector, elements in zip(selectors, candidates):
+        for element in elements:
+            if element.name == 'option' and element.get('value'):
+                size = element.get('value')
+            else:
+                size = element.get_text(strip=True)
+
+            if size and size not in sizes:
+                sizes.append(size)
+                if selector not in used:
+                    used.append(selector)
+    return sizes, used
+
+def resolve_delivery(selectors, candidates):
+    """Pick delivery information from the first selector that matched"""
+    for selector, element in zip(selectors, candidates):
+        if element is not None:
+            return element.get_text(strip=True), [selector]
+    return 'Delivery info not found', []
+
+def _resolve_fields(field_selectors, matches, stock_controls):
+    """Resolve every field in a plan; returns dict of field -> (value, used selectors)"""
+    results = {}
+    for field, selectors in field_selectors.items():
+        if field == 'availability':
+            results[field] = resolve_availability(selectors, matches[field], stock_controls)
+        else:
+            results[field] = FIELD_RESOLVERS[field](selectors, matches[field])
+    return results
+
+FIELD_RESOLVERS = {
+    'name': resolve_name,
+    'price': resolve_price,
+    'sizes': resolve_sizes,
+    'delivery': resolve_delivery
+}
+
+def extract_product_fields(soup, profile=None, fields=None):
+    """
+    Extract name, price, availability, sizes and delivery info in a single tree walk
+    profile maps field -> selectors remembered for this site; only those are tried,
+    falling back to the full selector list (in a second walk) for fields where
+    they no longer produce anything. fields limits extraction to some of the fields
+    Returns (fields, used) where fields holds the raw values (name/price are None
+    when not found) and used maps field -> selectors that produced each value
+    """
+    profile = profile or {}
+    fields = fields or list(FIELD_SELECTORS)
+    plan = {field: profile.get(field) or FIELD_SELECTORS[field] for field in fields}
+    matches, stock_controls = collect_selector_matches(soup, plan)
+    results = _resolve_fields(plan, matches, stock_controls)
+
+    stale = {field: FIELD_SELECTORS[field] for field in plan if profile.get(field) and not results[field][1]}
+    if stale:
+        matches, stock_controls = collect_selector_matches(soup, stale)
+        results.update(_resolve_fields(stale, matches, stock_controls))
+
+    fields = {field: value for field, (value, _) in results.items()}
+    used = {field: selectors for field, (_, selectors) in results.items() if selectors}
+    return fields, used
+
+def parse_html_fields(html, profile=None, fields=None):
+    """
+    Build the tree for a page and extract its fields; the entry point of the
+    scraper's parse processes, which import only this module
+    Returns (fields, used selectors) as from extract_product_fields
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    return extract_product_fields(soup, profile, fields)
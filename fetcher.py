@@ -0,0 +1,119 @@
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+import ratelimit
+
+# Fetch configuration
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+REQUEST_TIMEOUT = 10
+POOL_HOSTS = int(os.environ.get("FETCH_POOL_HOSTS", "100"))  # Hosts kept in the connection pool
+MAX_CONNECTIONS_PER_HOST = int(os.environ.get("FETCH_MAX_PER_HOST", "4"))
+MAX_CONCURRENT_FETCHES = int(os.environ.get("FETCH_CONCURRENCY", "32"))
+MAX_PAGE_BYTES = int(os.environ.get("FETCH_MAX_PAGE_BYTES", str(3 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Return the shared HTTP session
+    Connections are kept alive and reused per host, so repeated checks of the
+    same retailer skip the TCP and TLS handshakes
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # pool_block caps open connections per host; extra fetches wait for a free one
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_HOSTS,
+                    pool_maxsize=MAX_CONNECTIONS_PER_HOST,
+                    pool_block=True
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({'User-Agent': USER_AGENT})
+                _session = session
+    return _session
+
+def fetch_page(url, headers=None, stream=False):
+    """
+    Fetch a page over the shared session, raising for HTTP error statuses
+    Every fetch waits for a slot from the per-host rate limiter
+    """
+    ratelimit.acquire(url)
+    response = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=stream)
+    ratelimit.report_response(url, response.status_code, response.headers.get('Retry-After'))
+    if response.status_code >= 400:
+        response.close()
+    response.raise_for_status()
+    return response
+
+def fetch_page_body(url, headers=None, stop_at=None, max_bytes=None):
+    """
+    Stream a page body in chunks, stopping at max_bytes (default MAX_PAGE_BYTES)
+    stop_at is called with the bytes received so far after every chunk and may
+    return an offset to cut the body at and stop downloading
+    Returns (response, body)
+    """
+    max_bytes = max_bytes or MAX_PAGE_BYTES
+    response = fetch_page(url, headers=headers, stream=True)
+    body = bytearray()
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            body.extend(chunk)
+            if len(body) >= max_bytes:
+                logging.warning(f"{url} exceeded {max_bytes} bytes, truncating")
+                del body[max_bytes:]
+                break
+            if stop_at:
+                cut = stop_at(body)
+                if cut is not None:
+                    del body[cut:]
+                    break
+    finally:
+        response.close()
+    return response, bytes(body)
+
+def is_transient_error(error):
+    """Check whether a failed fetch may well succeed later: rate limiting, timeouts, connection and server errors"""
+    if isinstance(error, (ratelimit.RateLimited, requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+def fetch_many(urls, fetch=None, max_concurrency=None, errors=None):
+    """
+    Run `fetch` (default: fetch_page) for many URLs concurrently
+    Returns dict of url -> result, with None for URLs that failed; errors, if
+    given, is filled with url -> exception for the fetches that raised
+    """
+    fetch = fetch or fetch_page
+    urls = list(dict.fromkeys(urls))
+    results = {}
+    if not urls:
+        return results
+
+    def _fetch_one(url):
+        try:
+            return fetch(url), None
+        except ratelimit.RateLimited as e:
+            logging.warning(f"Deferred fetching {url}: {str(e)}")
+            return None, e
+        except Exception as e:
+            logging.error(f"Error fetching {url}: {str(e)}")
+            return None, e
+
+    workers = min(max_concurrency or MAX_CONCURRENT_FETCHES, len(urls))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch') as executor:
+        for url, (result, error) in zip(urls, executor.map(_fetch_one, urls)):
+            results[url] = result
+            if error is not None and errors is not None:
+                errors[url] = error
+    return results
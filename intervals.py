@@ -0,0 +1,87 @@
+import os
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from prices import price_amount
+
+# Adaptive check interval bounds (seconds)
+BASE_CHECK_INTERVAL = 300
+MIN_CHECK_INTERVAL = int(os.environ.get("MIN_CHECK_INTERVAL", "60"))
+MAX_CHECK_INTERVAL = int(os.environ.get("MAX_CHECK_INTERVAL", "3600"))
+
+BACKOFF_FACTOR = 1.5  # Interval growth after UNCHANGED_STREAK_STEP unchanged checks
+UNCHANGED_STREAK_STEP = 3
+VOLATILE_CHANGE_RATIO = 0.2  # Share of checks that saw a change for a page to count as volatile
+NEAR_TARGET_RATIO = 1.1  # Prices within 10% of the target are checked more often
+RESTOCK_WINDOW = timedelta(hours=1)  # Stock/size monitors stay fast for this long after a change
+
+_interval_stats = {'checks': 0, 'checks_avoided': 0.0, 'shortened': 0, 'lengthened': 0}
+_stats_lock = threading.Lock()
+
+def product_state_hash(product_info):
+    """Hash the parts of a product's state whose changes matter for conditions"""
+    state = '|'.join([
+        str(product_info.get('price')),
+        str(product_info.get('availability')),
+        ','.join(sorted(product_info.get('sizes') or [])),
+        str(product_info.get('delivery'))
+    ])
+    return hashlib.md5(state.encode('utf-8')).hexdigest()
+
+def _is_near_target(monitor, product_info):
+    if not monitor.check_price or not monitor.target_price:
+        return False
+    current_price = price_amount(product_info.get('price', ''))
+    return current_price is not None and current_price <= monitor.target_price * NEAR_TARGET_RATIO
+
+def update_check_interval(monitor, product_info, now=None):
+    """
+    Record a check's outcome in the monitor's history and pick its next interval
+    Intervals halve when the page changes, grow while it stays the same, and are
+    capped low for volatile pages, prices near the target and recent restocks
+    Returns the new interval in seconds
+    """
+    now = now or datetime.utcnow()
+    interval = monitor.check_interval or BASE_CHECK_INTERVAL
+    state_hash = product_state_hash(product_info)
+    changed = monitor.last_state_hash is not None and state_hash != monitor.last_state_hash
+
+    monitor.check_count = (monitor.check_count or 0) + 1
+    if changed:
+        monitor.change_count = (monitor.change_count or 0) + 1
+        monitor.unchanged_streak = 0
+        monitor.last_changed_at = now
+        interval = interval / 2
+    else:
+        monitor.unchanged_streak = (monitor.unchanged_streak or 0) + 1
+        if monitor.unchanged_streak % UNCHANGED_STREAK_STEP == 0:
+            interval = interval * BACKOFF_FACTOR
+    monitor.last_state_hash = state_hash
+
+    volatile = monitor.check_count >= 5 and monitor.change_count / monitor.check_count >= VOLATILE_CHANGE_RATIO
+    if volatile or _is_near_target(monitor, product_info):
+        interval = min(interval, 2 * MIN_CHECK_INTERVAL)
+    watches_stock = monitor.check_stock or monitor.check_size
+    if watches_stock and monitor.last_changed_at and now - monitor.last_changed_at < RESTOCK_WINDOW:
+        interval = MIN_CHECK_INTERVAL
+
+    interval = int(max(MIN_CHECK_INTERVAL, min(MAX_CHECK_INTERVAL, interval)))
+    monitor.check_interval = interval
+    _record_interval(interval)
+    return interval
+
+def _record_interval(interval):
+    """Count checks avoided (or added) relative to the fixed base interval"""
+    with _stats_lock:
+        _interval_stats['checks'] += 1
+        # Over `interval` seconds the fixed schedule would have made interval/BASE checks
+        _interval_stats['checks_avoided'] += interval / BASE_CHECK_INTERVAL - 1
+        if interval < BASE_CHECK_INTERVAL:
+            _interval_stats['shortened'] += 1
+        elif interval > BASE_CHECK_INTERVAL:
+            _interval_stats['lengthened'] += 1
+
+def get_interval_stats():
+    """Return adaptive interval metrics, including net checks avoided"""
+    with _stats_lock:
+        return dict(_interval_stats)
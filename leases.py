@@ -0,0 +1,170 @@
+import os
+import uuid
+import socket
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import PENDING_STATUS, JobLease, MonitorLease, MonitorWorker, ProductMonitor
+from scraper import normalize_product_url
+
+# Lease configuration (seconds); a worker that misses heartbeats for LEASE_TTL loses its monitors
+LEASE_TTL = int(os.environ.get("MONITOR_LEASE_TTL", "60"))
+HEARTBEAT_INTERVAL = int(os.environ.get("MONITOR_HEARTBEAT_INTERVAL", "15"))
+# New monitors are left to their setup for this long before workers check them anyway
+SETUP_TIMEOUT = int(os.environ.get("MONITOR_SETUP_TIMEOUT", "900"))
+
+def new_worker_id():
+    """Return a unique id for a worker process"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def live_workers(worker_id):
+    """Return the ids of the registered workers, always including worker_id itself"""
+    return sorted({worker_id} | {registered for registered, in db.session.query(MonitorWorker.id)})
+
+def product_owner(product_key, workers):
+    """
+    Return the worker that checks every monitor of a product, by its normalized URL
+    (rendezvous hashing). Each worker works this out on its own and they all agree;
+    when a worker joins or leaves, only the products it gains or loses move
+    Keeping a product in one process keeps its URL sharing, compiled conditions and
+    snapshot cache in one place, while a big retailer's products still spread over
+    every worker; the retailer's request budget is shared through the database
+    (see ratelimit)
+    """
+    return max(workers, key=lambda worker: hashlib.blake2b(
+        f"{worker}|{product_key}".encode('utf-8'), digest_size=8).digest())
+
+def claim_monitors(worker_id, monitor_ids=None, workers=None):
+    """
+    Take leases on active monitors nobody holds of the products this worker owns,
+    optionally limited to monitor_ids. Monitors still being set up are skipped
+    until SETUP_TIMEOUT after they were created
+    Two workers racing for the same monitor can't both win: the lease row's primary
+    key rejects the second insert
+    Returns list of (monitor_id, product_url, last_checked, check_interval) claimed
+    """
+    query = (db.session.query(ProductMonitor.id, ProductMonitor.product_url,
+                              ProductMonitor.last_checked, ProductMonitor.check_interval)
+             .outerjoin(MonitorLease, MonitorLease.monitor_id == ProductMonitor.id)
+             .filter(ProductMonitor.is_active == True, MonitorLease.monitor_id.is_(None),
+                     or_(ProductMonitor.last_status.is_(None), ProductMonitor.last_status != PENDING_STATUS,
+                         ProductMonitor.created_at < datetime.utcnow() - timedelta(seconds=SETUP_TIMEOUT))))
+    if monitor_ids is not None:
+        query = query.filter(ProductMonitor.id.in_(monitor_ids))
+    workers = workers or live_workers(worker_id)
+    candidates = [candidate for candidate in query
+                  if product_owner(normalize_product_url(candidate[1]), workers) == worker_id]
+    if not candidates:
+        return []
+
+    expires_at = datetime.utcnow() + timedelta(seconds=LEASE_TTL)
+    rows = [{'monitor_id': candidate[0], 'worker_id': worker_id, 'expires_at': expires_at} for candidate in candidates]
+    try:
+        db.session.execute(MonitorLease.__table__.insert(), rows)
+        db.session.commit()
+        return candidates
+    except IntegrityError:
+        db.session.rollback()
+
+    # Another worker got some of them first; take the rest one at a time
+    claimed = []
+    for row, candidate in zip(rows, candidates):
+        try:
+            db.session.execute(MonitorLease.__table__.insert(), row)
+            db.session.commit()
+            claimed.append(candidate)
+        except IntegrityError:
+            db.session.rollback()
+    return claimed
+
+def release_monitors(worker_id, monitor_ids):
+    """Give up this worker's leases on monitor_ids"""
+    if not monitor_ids:
+        return
+    (MonitorLease.query
+     .filter(MonitorLease.worker_id == worker_id, MonitorLease.monitor_id.in_(list(monitor_ids)))
+     .delete(synchronize_session=False))
+    db.session.commit()
+
+def retire_worker(worker_id):
+    """Drop a stopping worker's leases and registration so others take over right away"""
+    MonitorLease.query.filter_by(worker_id=worker_id).delete(synchronize_session=False)
+    JobLease.query.filter_by(worker_id=worker_id).delete(synchronize_session=False)
+    MonitorWorker.query.filter_by(id=worker_id).delete(synchronize_session=False)
+    db.session.commit()
+
+def claim_job(worker_id, job, ttl):
+    """
+    Take or renew this worker's lease on a named job for ttl seconds
+    Returns True while the worker holds it; a lease that isn't renewed can be taken over
+    """
+    now = datetime.utcnow()
+    JobLease.query.filter(JobLease.name == job, JobLease.expires_at < now).delete(synchronize_session=False)
+    renewed = (JobLease.query.filter_by(name=job, worker_id=worker_id)
+               .update({'expires_at': now + timedelta(seconds=ttl)}, synchronize_session=False))
+    if renewed:
+        db.session.commit()
+        return True
+    try:
+        db.session.add(JobLease(name=job, worker_id=worker_id, expires_at=now + timedelta(seconds=ttl)))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+def sync_leases(worker_id):
+    """
+    Heartbeat for a worker and rebalance monitors across the live workers
+    Renews the worker's leases, frees expired leases and those of stopped monitors,
+    then releases monitors of products another worker owns and claims the free ones
+    of products this worker owns (see product_owner)
+    Returns (monitor ids held, list of newly claimed rows as from claim_monitors)
+    """
+    now = datetime.utcnow()
+    worker = db.session.get(MonitorWorker, worker_id)
+    if worker is None:
+        db.session.add(MonitorWorker(id=worker_id, hostname=socket.gethostname(), pid=os.getpid(),
+                                     started_at=now, heartbeat_at=now))
+    else:
+        worker.heartbeat_at = now
+    (MonitorLease.query.filter_by(worker_id=worker_id)
+     .update({'expires_at': now + timedelta(seconds=LEASE_TTL)}, synchronize_session=False))
+
+    # Leases of workers that stopped heartbeating are up for grabs
+    MonitorLease.query.filter(MonitorLease.expires_at < now).delete(synchronize_session=False)
+    (MonitorWorker.query.filter(MonitorWorker.heartbeat_at < now - timedelta(seconds=LEASE_TTL))
+     .delete(synchronize_session=False))
+
+    # Monitors that were stopped or deleted give up their lease
+    stale = [monitor_id for monitor_id, in (
+        db.session.query(MonitorLease.monitor_id)
+        .outerjoin(ProductMonitor, ProductMonitor.id == MonitorLease.monitor_id)
+        .filter(MonitorLease.worker_id == worker_id,
+                or_(ProductMonitor.id.is_(None), ProductMonitor.is_active == False))
+    )]
+    if stale:
+        MonitorLease.query.filter(MonitorLease.monitor_id.in_(stale)).delete(synchronize_session=False)
+    db.session.commit()
+
+    workers = live_workers(worker_id)
+    held = set()
+    moved = []
+    for monitor_id, product_url in (db.session.query(MonitorLease.monitor_id, ProductMonitor.product_url)
+                                    .join(ProductMonitor, ProductMonitor.id == MonitorLease.monitor_id)
+                                    .filter(MonitorLease.worker_id == worker_id)):
+        if product_owner(normalize_product_url(product_url), workers) == worker_id:
+            held.add(monitor_id)
+        else:
+            moved.append(monitor_id)
+    if moved:
+        # A worker joined and now owns some of these products; hand them over for it to claim
+        release_monitors(worker_id, moved)
+        logging.info(f"Worker {worker_id} released {len(moved)} monitors to rebalance across {len(workers)} workers")
+
+    claimed = claim_monitors(worker_id, workers=workers)
+    held.update(row[0] for row in claimed)
+    return held, claimed
@@ -1,4 +1,18 @@
-from app import app
+# Parse processes (see scraper._get_parse_pool) import this module as __mp_main__;
+# they only need parse_worker, so they skip the app and its background work here
+if __name__ != '__mp_main__':
+    from app import app
+    import monitoring
+    import events
+    import monitor_setup
+
+    # Background work starts with the web server, not whenever `app` is imported
+    # /events is always fed from the database, wherever the checks run
+    events.start_status_relay()
+    if monitoring.MONITOR_MODE == 'embedded':
+        monitoring.start_monitoring()
+    # Setups run in the web processes; any a restart cut short are queued again
+    monitor_setup.resume_pending_setups()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
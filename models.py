@@ -1,6 +1,10 @@
+import logging
 from app import db
 from datetime import datetime
-from sqlalchemy import Text
+from sqlalchemy import Text, inspect, text
+
+# last_status of a monitor saved but not yet set up (see monitor_setup.py); workers leave these alone
+PENDING_STATUS = "Setting up: reading product page"
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,6 +18,14 @@ class User(db.Model):
     monitors = db.relationship('ProductMonitor', backref='user', lazy=True, cascade='all, delete-orphan')
 
 class ProductMonitor(db.Model):
+    # Dashboard lookups filter by owner and state, the monitoring workers scan by state
+    # and the live status relay and status polling read recently updated monitors
+    __table_args__ = (
+        db.Index('ix_product_monitor_user_id_is_active', 'user_id', 'is_active'),
+        db.Index('ix_product_monitor_is_active', 'is_active'),
+        db.Index('ix_product_monitor_updated_at', 'updated_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
@@ -35,12 +47,28 @@ class ProductMonitor(db.Model):
     last_checked = db.Column(db.DateTime, nullable=True)
     last_status = db.Column(db.String(100), nullable=True)
     
+    # Adaptive check interval and change history
+    check_interval = db.Column(db.Integer, default=300)  # Seconds until the next check
+    check_count = db.Column(db.Integer, default=0)
+    change_count = db.Column(db.Integer, default=0)
+    unchanged_streak = db.Column(db.Integer, default=0)
+    last_changed_at = db.Column(db.DateTime, nullable=True)
+    last_state_hash = db.Column(db.String(32), nullable=True)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Moves on every write, including bulk updates, so pollers can find any changed row
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship to notifications
     notifications = db.relationship('Notification', backref='monitor', lazy=True, cascade='all, delete-orphan')
 
 class Notification(db.Model):
+    __table_args__ = (
+        db.Index('ix_notification_monitor_id_sent_at', 'monitor_id', 'sent_at'),
+        # The status relay (events.py) polls recently sent notifications of every monitor
+        db.Index('ix_notification_status_sent_at', 'status', 'sent_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     monitor_id = db.Column(db.Integer, db.ForeignKey('product_monitor.id'), nullable=False)
     
@@ -48,3 +76,111 @@ class Notification(db.Model):
     message = db.Column(Text, nullable=False)
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='sent')  # 'sent', 'failed'
+
+class UserEvent(db.Model):
+    """An event for a user's dashboard, stored by the process that produced it so every web process can relay it"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    event = db.Column(db.String(20), nullable=False)
+    data = db.Column(Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class ExtractionProfile(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    host = db.Column(db.String(255), unique=True, nullable=False)
+    
+    # JSON object of field -> selectors that produced the value on this host
+    selectors = db.Column(Text, nullable=False)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ProductSnapshot(db.Model):
+    """Append-only product state history per URL; most rows hold only the fields that changed"""
+    __table_args__ = (db.Index('ix_product_snapshot_url_key_taken_at', 'url_key', 'taken_at'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url_key = db.Column(db.String(32), nullable=False)  # Hash of the normalized product URL
+    taken_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Full state on keyframes, otherwise a JSON object of changed field -> new value
+    is_keyframe = db.Column(db.Boolean, default=False, nullable=False)
+    changes = db.Column(Text, nullable=False)
+
+class PricePoint(db.Model):
+    """Raw numeric price observations, kept for PRICE_RAW_RETENTION before rollup"""
+    __table_args__ = (db.Index('ix_price_point_url_key_recorded_at', 'url_key', 'recorded_at'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url_key = db.Column(db.String(32), nullable=False)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+
+class PriceRollup(db.Model):
+    """Hourly and daily min/max/last price per product"""
+    __table_args__ = (db.UniqueConstraint('url_key', 'resolution', 'bucket_start', name='uq_price_rollup_bucket'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url_key = db.Column(db.String(32), nullable=False)
+    resolution = db.Column(db.String(10), nullable=False)  # 'hour' or 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    min_price = db.Column(db.Float, nullable=False)
+    max_price = db.Column(db.Float, nullable=False)
+    last_price = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+
+class MonitorWorker(db.Model):
+    """A process running monitor checks; rows whose heartbeat stops are cleaned up by the others"""
+    id = db.Column(db.String(64), primary_key=True)
+    hostname = db.Column(db.String(255), nullable=True)
+    pid = db.Column(db.Integer, nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class MonitorLease(db.Model):
+    """Claim on one monitor by one worker; a lease that isn't renewed can be taken over"""
+    monitor_id = db.Column(db.Integer, db.ForeignKey('product_monitor.id', ondelete='CASCADE'), primary_key=True)
+    worker_id = db.Column(db.String(64), nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class JobLease(db.Model):
+    """Claim by one worker on a background job that must only run in one process at a time"""
+    name = db.Column(db.String(64), primary_key=True)
+    worker_id = db.Column(db.String(64), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class HostBudget(db.Model):
+    """
+    Request budget of one host shared by every worker fetching from it
+    next_at is when the host's next request is due at its rate (Unix time); a worker
+    may run up to the burst ahead of it. blocked_until holds the latest backoff
+    """
+    host = db.Column(db.String(255), primary_key=True)
+    next_at = db.Column(db.Float, nullable=False)
+    blocked_until = db.Column(db.Float, nullable=False, default=0.0)
+
+def upgrade_schema():
+    """
+    Add columns and indexes introduced after a table was first created
+    db.create_all() only creates missing tables, so existing databases need this
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" DEFAULT {column.default.arg!r}"
+                connection.execute(text(ddl))
+                logging.info(f"Added column {table.name}.{column.name}")
+            
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    logging.info(f"Added index {index.name}")
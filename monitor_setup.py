@@ -0,0 +1,257 @@
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app import app, db
+from models import PENDING_STATUS, ProductMonitor, User
+from scraper import get_shared_product_info, normalize_product_url
+from fetcher import fetch_many, is_transient_error
+from notifications import monitoring_confirmation_message, send_monitoring_confirmation, whatsapp_configured
+from dispatch import queue_notification
+from events import record_event
+from leases import SETUP_TIMEOUT, claim_job, new_worker_id
+from results import RESULT_COLUMN_LENGTHS
+from monitoring import start_monitoring_for_products
+
+# New monitors are saved straight away and set up (first scrape, confirmation) in the background
+SETUP_WORKERS = int(os.environ.get("MONITOR_SETUP_WORKERS", "4"))
+STARTED_STATUS = "Monitoring started"
+FAILED_STATUS = "Unable to scrape product information. Please check the URL."
+# Setup is retried after transient fetch failures, backing off up to the max delay
+SETUP_RETRY_DELAY = 30
+SETUP_RETRY_MAX_DELAY = 300
+# Setups lost with a restart are queued again by whichever process starts first
+RESUME_SETUP_JOB = 'resume-setup'
+RESUME_SETUP_TTL = 60
+
+_executor = ThreadPoolExecutor(max_workers=SETUP_WORKERS, thread_name_prefix='monitor-setup')
+
+def queue_monitor_setup(monitor_id, email, phone_number, conditions, notification_pref):
+    """Run the first scrape, monitoring start and confirmation for a newly saved monitor in the background"""
+    _executor.submit(_setup_monitor, monitor_id, email, phone_number, conditions, notification_pref)
+
+def queue_bulk_setup(monitor_ids, email, phone_number, notification_pref):
+    """Set up many imported monitors in the background, with one summary confirmation"""
+    _executor.submit(_setup_monitors, list(monitor_ids), email, phone_number, notification_pref)
+
+def _retry_setup(created_at, attempt, retry_in, setup, *args):
+    """
+    Run a setup again later after a transient fetch failure, while its monitors are
+    within SETUP_TIMEOUT of being created; past that they stay pending and monitoring
+    workers check them like any other monitor. retry_in is the least delay the
+    failure asked for, such as a rate limited host's wait
+    Returns whether the retry was scheduled
+    """
+    delay = max(min(SETUP_RETRY_DELAY * 2 ** attempt, SETUP_RETRY_MAX_DELAY), retry_in)
+    if datetime.utcnow() + timedelta(seconds=delay) > created_at + timedelta(seconds=SETUP_TIMEOUT):
+        return False
+    timer = threading.Timer(delay, _executor.submit, args=(setup,) + args, kwargs={'attempt': attempt + 1})
+    timer.daemon = True
+    timer.start()
+    return True
+
+def _setup_values(product_info):
+    """Columns a first scrape writes, cut to their column lengths"""
+    if not product_info:
+        return {'is_active': False, 'last_status': FAILED_STATUS}
+    values = {'product_name': product_info.get('name', 'Unknown Product'),
+              'product_price': product_info.get('price', 'N/A'),
+              'last_status': STARTED_STATUS}
+    for column, length in RESULT_COLUMN_LENGTHS.items():
+        if isinstance(values.get(column), str):
+            values[column] = values[column][:length]
+    return values
+
+def _move_off_pending(monitor_id, product_info):
+    """Write one monitor's setup result while it is still pending; returns whether it was"""
+    return bool(ProductMonitor.query.filter_by(id=monitor_id, last_status=PENDING_STATUS)
+                .update(_setup_values(product_info), synchronize_session=False))
+
+def _apply_setup(monitor_ids, product_infos):
+    """
+    Write first-scrape results for pending monitors in one transaction and start monitoring them
+    product_infos maps monitor_id -> product info, or None where the page couldn't be scraped.
+    Monitors whose page failed are stopped. A worker process may already be checking a
+    monitor set up late, and a setup resumed after a restart may race the original, so
+    monitors are only written while they still read as pending. If the transaction
+    fails, monitors are written one at a time; any that still fail stay pending for
+    the monitoring workers
+    Returns the monitors this call moved off pending, reloaded
+    """
+    try:
+        moved = [monitor_id for monitor_id in monitor_ids
+                 if _move_off_pending(monitor_id, product_infos.get(monitor_id))]
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.warning(f"Failed to write setup of {len(monitor_ids)} monitors in one batch, "
+                        f"writing them one at a time: {str(e)}")
+        moved = []
+        for monitor_id in monitor_ids:
+            try:
+                if _move_off_pending(monitor_id, product_infos.get(monitor_id)):
+                    moved.append(monitor_id)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Failed to write setup of monitor {monitor_id}, leaving it pending: {str(e)}")
+
+    monitors = ProductMonitor.query.filter(ProductMonitor.id.in_(moved)).all() if moved else []
+    start_monitoring_for_products([monitor_id for monitor_id in moved if product_infos.get(monitor_id)])
+    return monitors
+
+def _setup_monitor(monitor_id, email, phone_number, conditions, notification_pref, attempt=0):
+    """Fill in a pending monitor's product name and price, start monitoring it and confirm it to the user"""
+    with app.app_context():
+        try:
+            monitor = db.session.get(ProductMonitor, monitor_id)
+            if monitor is None or not monitor.is_active or monitor.last_status != PENDING_STATUS:
+                return
+            try:
+                product_info = get_shared_product_info(monitor.product_url)
+            except Exception as e:
+                # Rate limited, timed out or a server error: the page may well work later
+                if _retry_setup(monitor.created_at, attempt, getattr(e, 'retry_in', 0), _setup_monitor,
+                                monitor_id, email, phone_number, conditions, notification_pref):
+                    logging.warning(f"Setup of monitor {monitor_id} will be retried: {str(e)}")
+                else:
+                    logging.warning(f"Setup of monitor {monitor_id} timed out, leaving it to monitoring workers: {str(e)}")
+                return
+            monitors = _apply_setup([monitor_id], {monitor_id: product_info})
+            if not monitors:
+                return
+            monitor = monitors[0]
+
+            if not product_info:
+                record_event(monitor.user_id, 'setup', {'id': monitor_id, 'ok': False, 'message': FAILED_STATUS})
+                logging.warning(f"Setup of monitor {monitor_id} failed: could not scrape {monitor.product_url}")
+                return
+
+            confirmation_sent = send_monitoring_confirmation(
+                email, phone_number, monitor.product_name, conditions, notification_pref
+            )
+            message = f"Monitoring started for {monitor.product_name}."
+            if confirmation_sent:
+                message += " Confirmation sent to your email/WhatsApp."
+            record_event(monitor.user_id, 'setup', {'id': monitor_id, 'ok': True, 'message': message})
+            logging.info(f"Monitor {monitor_id} set up for {monitor.product_name}")
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error setting up monitor {monitor_id}: {str(e)}")
+        finally:
+            db.session.remove()
+
+def _setup_monitors(monitor_ids, email, phone_number, notification_pref, attempt=0):
+    """
+    Set up imported monitors together
+    Each distinct product URL is scraped once, concurrently over the shared fetch pool.
+    Monitors whose fetch failed transiently (a large import from one host runs into
+    its rate limit) stay pending and are set up again together later
+    """
+    with app.app_context():
+        try:
+            rows = (db.session.query(ProductMonitor.id, ProductMonitor.product_url, ProductMonitor.created_at)
+                    .filter(ProductMonitor.id.in_(monitor_ids), ProductMonitor.is_active == True,
+                            ProductMonitor.last_status == PENDING_STATUS)
+                    .all())
+            urls = {}
+            for _, product_url, _ in rows:
+                urls.setdefault(normalize_product_url(product_url), product_url)
+            errors = {}
+            results = fetch_many(urls.keys(), fetch=lambda key: get_shared_product_info(urls[key]), errors=errors)
+            transient = {key: error for key, error in errors.items() if is_transient_error(error)}
+
+            retry = [row for row in rows if normalize_product_url(row[1]) in transient]
+            if retry:
+                retry_in = max(getattr(error, 'retry_in', 0) for error in transient.values())
+                retry_ids = [monitor_id for monitor_id, _, _ in retry]
+                if _retry_setup(min(created_at for _, _, created_at in retry), attempt, retry_in,
+                                _setup_monitors, retry_ids, email, phone_number, notification_pref):
+                    logging.warning(f"Setup of {len(retry)} imported monitors will be retried")
+                else:
+                    logging.warning(f"Setup of {len(retry)} imported monitors timed out, leaving them to monitoring workers")
+
+            product_infos = {
+                monitor_id: results.get(normalize_product_url(product_url))
+                for monitor_id, product_url, _ in rows if normalize_product_url(product_url) not in transient
+            }
+            monitors = _apply_setup(list(product_infos), product_infos) if product_infos else []
+            if not monitors:
+                return
+
+            ready = [monitor for monitor in monitors if product_infos.get(monitor.id)]
+            message = f"{'Imported' if attempt == 0 else 'Set up'} {len(monitors)} monitors: {len(ready)} started"
+            if len(ready) < len(monitors):
+                message += f", {len(monitors) - len(ready)} could not be scraped"
+            if retry:
+                message += f", {len(retry)} still being set up"
+            record_event(monitors[0].user_id, 'setup', {'id': None, 'ok': bool(ready), 'message': message + '.'})
+            logging.info(message)
+
+            if ready:
+                _queue_bulk_confirmation(ready, email, phone_number, notification_pref)
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error setting up {len(monitor_ids)} imported monitors: {str(e)}")
+        finally:
+            db.session.remove()
+
+def _queue_bulk_confirmation(monitors, email, phone_number, notification_pref):
+    """Confirm a batch of started monitors in one message per channel"""
+    products = "\n".join(f"• {monitor.product_name}" for monitor in monitors)
+    message = f"""🛍️ ShopMate Monitoring Started!
+
+Now monitoring {len(monitors)} products:
+{products}
+
+We'll notify you as soon as your conditions are met. You can check your dashboard anytime to see the status.
+
+Happy shopping! 🎉"""
+    if email:
+        queue_notification('email', email, message, subject="ShopMate - Monitoring Started")
+    if notification_pref == 'email_whatsapp' and phone_number and whatsapp_configured():
+        queue_notification('whatsapp', phone_number, message)
+
+def confirm_started_monitor(monitor):
+    """
+    Confirm a monitor whose setup never finished, once a monitoring check has filled
+    in its product; this is the confirmation its setup would have sent
+    """
+    conditions = {field: getattr(monitor, field) for field in
+                  ('check_stock', 'check_size', 'desired_size', 'check_delivery', 'check_price', 'target_price')}
+    message = monitoring_confirmation_message(monitor.product_name, conditions)
+    user = monitor.user
+    if user.email:
+        queue_notification('email', user.email, message, subject="ShopMate - Monitoring Started")
+    if user.notification_preference == 'email_whatsapp' and user.phone_number and whatsapp_configured():
+        queue_notification('whatsapp', user.phone_number, message)
+
+def resume_pending_setups():
+    """
+    Queue setup again for monitors still pending from before a restart, grouped per user
+    Only monitors within SETUP_TIMEOUT of creation: older ones are checked, and
+    confirmed, by monitoring workers. Of processes starting together only one does it
+    """
+    with app.app_context():
+        try:
+            if not claim_job(new_worker_id(), RESUME_SETUP_JOB, RESUME_SETUP_TTL):
+                return
+            rows = (db.session.query(ProductMonitor.id, ProductMonitor.user_id)
+                    .filter(ProductMonitor.is_active == True, ProductMonitor.last_status == PENDING_STATUS,
+                            ProductMonitor.created_at >= datetime.utcnow() - timedelta(seconds=SETUP_TIMEOUT))
+                    .all())
+            by_user = {}
+            for monitor_id, user_id in rows:
+                by_user.setdefault(user_id, []).append(monitor_id)
+            for user in User.query.filter(User.id.in_(list(by_user))) if by_user else []:
+                queue_bulk_setup(by_user[user.id], user.email, user.phone_number, user.notification_preference)
+            if rows:
+                logging.info(f"Resumed setup of {len(rows)} pending monitors")
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to resume pending monitor setups: {str(e)}")
+        finally:
+            db.session.remove()
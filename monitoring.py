@@ -1,75 +1,566 @@
+import os
+import sys
+import atexit
+import signal
+import heapq
+import itertools
 import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from app import app, db
-from models import ProductMonitor, User
-from scraper import check_product_conditions
+from sqlalchemy.orm import joinedload
+from models import PENDING_STATUS, ProductMonitor
+from scraper import get_fetch_stats, get_shared_product_info, normalize_product_url, record_fetches_saved
+from prices import get_price_cache_stats, price_amount
+from fetcher import fetch_many
+from results import flush_results, record_result
+from intervals import get_interval_stats, update_check_interval, product_state_hash
+from snapshots import forget_latest_states, record_snapshot
+from conditions import evaluate_product, forget_monitor_conditions
+from pricehistory import record_price, start_price_rollups
 from notifications import send_notification
+from digest import flush_digests, get_digest_stats
+from dispatch import drain_notifications
+from ratelimit import RateLimited, get_host_stats, host_key, host_rate
+from leases import (
+    HEARTBEAT_INTERVAL, claim_monitors, new_worker_id, release_monitors, retire_worker, sync_leases
+)
 
-# Global dictionary to store monitoring threads
-monitoring_threads = {}
+# Scheduling configuration
+CHECK_INTERVAL = 300  # Default seconds between checks; see intervals.py for per-monitor intervals
+RETRY_INTERVAL = 60  # Seconds to wait after a failed check
+NOT_MET_STATUS = "Conditions not yet met"
+MAX_WORKERS = int(os.environ.get("MONITOR_WORKERS", "8"))
+CHECK_BATCH_SIZE = int(os.environ.get("MONITOR_BATCH_SIZE", "50"))  # Due monitors handed to a worker at once
+# 'embedded' runs monitoring inside the web process; 'worker' leaves it to `python -m monitoring worker`
+MONITOR_MODE = os.environ.get("MONITOR_MODE", "embedded")
+STATS_LOG_INTERVAL = int(os.environ.get("MONITOR_STATS_INTERVAL", "300"))  # Seconds between counter log lines
+STOP_TIMEOUT = int(os.environ.get("MONITOR_STOP_TIMEOUT", "30"))  # Seconds running checks get to finish on shutdown
 
-def monitor_product(monitor_id):
-    """Monitor a single product continuously"""
+# Central schedule: heap of (due_time, seq, monitor_id) entries. A monitor's
+# live entry is the one whose seq matches _scheduled[monitor_id]; anything else
+# in the heap is stale and gets dropped when it reaches the top.
+_schedule_heap = []
+_scheduled = {}
+_in_flight = set()
+_cancelled = set()
+_pending_delays = {}
+_seq = itertools.count()
+_schedule_cond = threading.Condition()
+_worker_slots = threading.BoundedSemaphore(MAX_WORKERS)
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='monitor-check')
+_scheduler_thread = None
+
+# Monitors this process holds leases on (see leases.py)
+_worker_id = None
+_leased = set()
+_leases_lock = threading.Lock()
+_lease_thread = None
+_stopping = threading.Event()
+_stop_lock = threading.Lock()
+_exit_hook_registered = False
+
+def check_monitors(monitor_ids):
+    """
+    Run one check for a batch of monitors
+    Monitors and their users are loaded in one query, each distinct product URL is
+    scraped once (concurrently), and results go to the buffered result sink
+    Returns dict of monitor_id -> delay in seconds until the next check, or None to stop monitoring
+    """
+    delays = dict.fromkeys(monitor_ids)
     with app.app_context():
-        while True:
-            try:
-                monitor = ProductMonitor.query.get(monitor_id)
-                if not monitor or not monitor.is_active:
-                    break
-                
-                user = User.query.get(monitor.user_id)
-                if not user:
+        try:
+            monitors = (ProductMonitor.query
+                        .options(joinedload(ProductMonitor.user))
+                        .filter(ProductMonitor.id.in_(monitor_ids))
+                        .all())
+            monitors = [monitor for monitor in monitors if monitor.is_active and monitor.user]
+
+            # Results up to most of a monitor's own interval old are fresh enough
+            urls = {}
+            for monitor in monitors:
+                key = normalize_product_url(monitor.product_url)
+                max_age = 0.8 * (monitor.check_interval or CHECK_INTERVAL)
+                url, current_max_age = urls.get(key, (monitor.product_url, max_age))
+                urls[key] = (url, min(max_age, current_max_age))
+            record_fetches_saved(len(monitors) - len(urls))
+            errors = {}
+            product_infos = fetch_many(
+                urls.keys(), fetch=lambda key: get_shared_product_info(urls[key][0], max_age=urls[key][1]),
+                errors=errors
+            )
+            deferred = _deferred_delays(urls, errors)
+
+            # Append each product's state to its history; unchanged products write nothing
+            url_changes = {}
+            for key, product_info in product_infos.items():
+                if product_info:
+                    url_changes[key] = record_snapshot(urls[key][0], product_info)
+                    record_price(urls[key][0], price_amount(product_info.get('price') or ''))
+
+            # Evaluate the monitors of each product together, skipping any whose
+            # product hasn't changed since they last found their conditions unmet
+            by_url = {}
+            for monitor in monitors:
+                by_url.setdefault(normalize_product_url(monitor.product_url), []).append(monitor)
+            evaluations = {}
+            for key, url_monitors in by_url.items():
+                product_info = product_infos.get(key)
+                if not product_info:
+                    continue
+                state_hash = product_state_hash(product_info)
+                pending = [
+                    monitor for monitor in url_monitors
+                    if url_changes.get(key) or monitor.last_status != NOT_MET_STATUS
+                    or monitor.last_state_hash != state_hash
+                ]
+                evaluations.update(evaluate_product(key, pending, product_info))
+
+            for monitor in monitors:
+                key = normalize_product_url(monitor.product_url)
+                if key in deferred:
+                    # The host had no request slot; this isn't a failed check, just a later one
+                    delays[monitor.id] = deferred[key]
+                    continue
+                delays[monitor.id] = _apply_check(monitor, product_infos.get(key), evaluations.get(monitor.id))
+
+        except Exception as e:
+            logging.error(f"Error checking monitors {monitor_ids}: {str(e)}")
+            delays = dict.fromkeys(monitor_ids, RETRY_INTERVAL)
+        finally:
+            # Results were handed to the sink; drop any ORM-level changes
+            db.session.rollback()
+            db.session.remove()
+    return delays
+
+def _deferred_delays(urls, errors):
+    """
+    Delays until the URLs whose fetch the rate limiter deferred are tried again
+    Each host's URLs come back one request slot apart instead of all at once
+    Returns dict of normalized url -> delay in seconds
+    """
+    by_host = {}
+    for key, error in errors.items():
+        if isinstance(error, RateLimited):
+            by_host.setdefault(error.host, []).append((key, error.retry_in))
+    delays = {}
+    for host, entries in by_host.items():
+        spacing = 1 / host_rate(host)
+        for index, (key, retry_in) in enumerate(entries):
+            delays[key] = retry_in + index * spacing
+    return delays
+
+def _apply_check(monitor, product_info, evaluation=None):
+    """
+    Apply one monitor's check outcome; returns its next delay or None
+    evaluation is the monitor's (should_notify, message), or None when evaluation
+    was skipped because nothing changed
+    """
+    try:
+        # Setup gave up on (or lost) a monitor still pending; its first good check finishes it
+        completes_setup = bool(product_info) and monitor.last_status == PENDING_STATUS
+        if product_info:
+            should_notify, message = evaluation or (False, monitor.last_status)
+            next_check = update_check_interval(monitor, product_info)
+        else:
+            should_notify, message = False, "Unable to check product"
+            next_check = monitor.check_interval or CHECK_INTERVAL
+
+        # Update last checked time
+        monitor.last_checked = datetime.utcnow()
+        monitor.last_status = message
+        if product_info and price_amount(product_info.get('price') or '') is not None:
+            monitor.product_price = product_info['price']
+        if product_info and not monitor.product_name:
+            monitor.product_name = product_info.get('name') or 'Unknown Product'
+
+        alert_queued = False
+        if should_notify:
+            # Send notification
+            if send_notification(monitor.user, monitor, message):
+                logging.info(f"Notification queued for monitor {monitor.id}")
+                alert_queued = True
+            else:
+                logging.error(f"Failed to send notification for monitor {monitor.id}")
+
+        record_result(monitor)
+        if completes_setup:
+            # Imported here: monitor_setup imports this module
+            from monitor_setup import confirm_started_monitor
+            confirm_started_monitor(monitor)
+        # The dispatcher stops the monitor once the alert is delivered, or hands
+        # it back through resume_monitor if delivery fails
+        return None if alert_queued else next_check
+
+    except Exception as e:
+        logging.error(f"Error checking monitor {monitor.id}: {str(e)}")
+        return RETRY_INTERVAL
+
+def _compact_schedule():
+    """Drop stale heap entries once they outnumber the live ones (caller holds the lock)"""
+    global _schedule_heap
+    if len(_schedule_heap) > 2 * len(_scheduled) + 1024:
+        _schedule_heap = [entry for entry in _schedule_heap if _scheduled.get(entry[2]) == entry[1]]
+        heapq.heapify(_schedule_heap)
+
+def _run_checks(monitor_ids):
+    """Worker pool entry point: check a batch of monitors and put them back on the schedule"""
+    try:
+        delays = check_monitors(monitor_ids)
+    except Exception as e:
+        logging.error(f"Unexpected error checking monitors {monitor_ids}: {str(e)}")
+        delays = dict.fromkeys(monitor_ids, RETRY_INTERVAL)
+    finally:
+        _worker_slots.release()
+
+    for monitor_id in monitor_ids:
+        delay = delays.get(monitor_id)
+        with _schedule_cond:
+            _in_flight.discard(monitor_id)
+            cancelled = monitor_id in _cancelled
+            _cancelled.discard(monitor_id)
+            if delay is not None and monitor_id in _pending_delays:
+                delay = _pending_delays.pop(monitor_id)
+            _pending_delays.pop(monitor_id, None)
+        if delay is not None and not cancelled:
+            schedule_monitor(monitor_id, delay, replace=False)
+    with _schedule_cond:
+        # Wake stop_monitoring if it is waiting for running checks
+        _schedule_cond.notify_all()
+
+def _scheduler_loop():
+    """Pop due monitors off the heap and dispatch them to the worker pool in batches"""
+    while True:
+        with _schedule_cond:
+            batch = []
+            while True:
+                if not _schedule_heap:
+                    if batch:
+                        break
+                    _schedule_cond.wait()
+                    continue
+                due_time, seq, monitor_id = _schedule_heap[0]
+                if _scheduled.get(monitor_id) != seq:
+                    heapq.heappop(_schedule_heap)
+                    continue
+                wait = due_time - time.monotonic()
+                if wait > 0:
+                    if batch:
+                        break
+                    _schedule_cond.wait(wait)
+                    continue
+                heapq.heappop(_schedule_heap)
+                del _scheduled[monitor_id]
+                _in_flight.add(monitor_id)
+                batch.append(monitor_id)
+                if len(batch) >= CHECK_BATCH_SIZE:
                     break
-                
-                # Check product conditions
-                should_notify, message = check_product_conditions(monitor)
-                
-                # Update last checked time
-                monitor.last_checked = datetime.utcnow()
-                monitor.last_status = message
-                
-                if should_notify:
-                    # Send notification
-                    if send_notification(user, monitor, message):
-                        logging.info(f"Notification sent for monitor {monitor_id}")
-                        # Stop monitoring after successful notification
-                        monitor.is_active = False
-                    else:
-                        logging.error(f"Failed to send notification for monitor {monitor_id}")
-                
-                db.session.commit()
-                
-                # Wait 5 minutes before next check
-                time.sleep(300)
-                
-            except Exception as e:
-                logging.error(f"Error in monitoring thread for monitor {monitor_id}: {str(e)}")
-                time.sleep(60)  # Wait 1 minute before retrying
-        
-        # Clean up thread reference
-        if monitor_id in monitoring_threads:
-            del monitoring_threads[monitor_id]
+
+        # Block here when every worker is busy so the pool never queues unboundedly
+        _worker_slots.acquire()
+        try:
+            _executor.submit(_run_checks, batch)
+        except Exception as e:
+            logging.error(f"Failed to dispatch checks for monitors {batch}: {str(e)}")
+            _worker_slots.release()
+            with _schedule_cond:
+                _in_flight.difference_update(batch)
+            for monitor_id in batch:
+                schedule_monitor(monitor_id, RETRY_INTERVAL)
+
+def _ensure_scheduler_running():
+    """Start the scheduler thread on first use"""
+    global _scheduler_thread
+    if _scheduler_thread is None or not _scheduler_thread.is_alive():
+        _scheduler_thread = threading.Thread(target=_scheduler_loop, name='monitor-scheduler', daemon=True)
+        _scheduler_thread.start()
+
+def schedule_monitor(monitor_id, delay=0, replace=True):
+    """
+    Schedule the next check for a monitor in `delay` seconds
+    With replace=False an existing schedule entry is left untouched
+    """
+    with _schedule_cond:
+        if monitor_id in _scheduled and not replace:
+            return
+        if monitor_id in _in_flight:
+            # The running check reschedules the monitor itself when it finishes
+            _cancelled.discard(monitor_id)
+            if replace:
+                _pending_delays[monitor_id] = delay
+            return
+        seq = next(_seq)
+        _scheduled[monitor_id] = seq
+        heapq.heappush(_schedule_heap, (time.monotonic() + delay, seq, monitor_id))
+        _compact_schedule()
+        _schedule_cond.notify()
+        _ensure_scheduler_running()
+
+def reschedule_monitor(monitor_id, delay=0):
+    """Move a monitor's next check to `delay` seconds from now"""
+    schedule_monitor(monitor_id, delay, replace=True)
+
+def unschedule_monitor(monitor_id):
+    """Remove a monitor from the schedule, including a check that is currently running"""
+    with _schedule_cond:
+        removed = _scheduled.pop(monitor_id, None) is not None
+        if monitor_id in _in_flight:
+            _cancelled.add(monitor_id)
+            removed = True
+        _compact_schedule()
+        _schedule_cond.notify()
+    # Its conditions leave the product's compiled index with it
+    forget_monitor_conditions([monitor_id])
+    return removed
+
+def is_monitor_scheduled(monitor_id):
+    """Check whether a monitor is waiting on the schedule or being checked"""
+    with _schedule_cond:
+        return (monitor_id in _scheduled or monitor_id in _in_flight) and monitor_id not in _cancelled
 
 def start_monitoring_for_product(monitor_id):
     """Start monitoring for a specific product"""
-    if monitor_id in monitoring_threads:
+    if is_monitor_scheduled(monitor_id):
         logging.info(f"Monitor {monitor_id} is already being monitored")
         return
-    
-    thread = threading.Thread(target=monitor_product, args=(monitor_id,), daemon=True)
-    thread.start()
-    monitoring_threads[monitor_id] = thread
+
+    if _worker_id is None:
+        # Monitoring runs in separate worker processes; one claims it on its next sync
+        logging.info(f"Monitor {monitor_id} will be picked up by a monitoring worker")
+        return
+
+    with app.app_context():
+        try:
+            claimed = claim_monitors(_worker_id, monitor_ids=[monitor_id])
+        finally:
+            db.session.remove()
+    if not claimed:
+        logging.info(f"Monitor {monitor_id} is already leased by another worker")
+        return
+    with _leases_lock:
+        _leased.add(monitor_id)
+    schedule_monitor(monitor_id)
     logging.info(f"Started monitoring for product {monitor_id}")
 
-def start_all_active_monitoring():
-    """Start monitoring for all active monitors on app startup"""
+def start_monitoring_for_products(monitor_ids):
+    """Start monitoring many products with one lease claim; returns the ids started in this process"""
+    monitor_ids = [monitor_id for monitor_id in monitor_ids if not is_monitor_scheduled(monitor_id)]
+    if not monitor_ids:
+        return []
+
+    if _worker_id is None:
+        logging.info(f"{len(monitor_ids)} monitors will be picked up by monitoring workers")
+        return []
+
+    with app.app_context():
+        try:
+            claimed = claim_monitors(_worker_id, monitor_ids=monitor_ids)
+        finally:
+            db.session.remove()
+    started = [row[0] for row in claimed]
+    with _leases_lock:
+        _leased.update(started)
+    _schedule_claimed(claimed)
+    logging.info(f"Started monitoring for {len(started)} products")
+    return started
+
+def resume_monitor(monitor_id):
+    """Check a monitor again after its alert couldn't be delivered"""
+    with _leases_lock:
+        leased = monitor_id in _leased
+    if leased:
+        schedule_monitor(monitor_id, RETRY_INTERVAL, replace=False)
+        logging.info(f"Alert for monitor {monitor_id} was not delivered, checking it again")
+
+def stop_monitoring_for_product(monitor_id):
+    """Stop monitoring for a specific product"""
+    if unschedule_monitor(monitor_id):
+        logging.info(f"Stopped monitoring for product {monitor_id}")
+    with _leases_lock:
+        leased = monitor_id in _leased
+        _leased.discard(monitor_id)
+    if leased:
+        with app.app_context():
+            try:
+                release_monitors(_worker_id, [monitor_id])
+            finally:
+                db.session.remove()
+
+def _schedule_claimed(rows):
+    """
+    Schedule newly leased monitors
+    Monitors keep their cadence from their last check; overdue ones have each
+    retailer's product URLs spread evenly over one interval (or further apart if
+    the host's rate limit needs it), offsetting hosts from each other, instead of
+    firing them all at once. Monitors of the same URL stay together for one fetch
+    """
+    now = datetime.utcnow()
+    by_host = {}
+    for monitor_id, product_url, last_checked, check_interval in rows:
+        if last_checked is None:
+            schedule_monitor(monitor_id, replace=False)
+            continue
+        due_in = (last_checked - now).total_seconds() + (check_interval or CHECK_INTERVAL)
+        if due_in > 0:
+            schedule_monitor(monitor_id, due_in, replace=False)
+        else:
+            by_url = by_host.setdefault(host_key(product_url), {})
+            by_url.setdefault(normalize_product_url(product_url), []).append(monitor_id)
+    for host_index, (host, by_url) in enumerate(by_host.items()):
+        spacing = max(CHECK_INTERVAL / len(by_url), 1 / host_rate(host))
+        phase = (host_index * spacing / max(len(by_host), 1)) % CHECK_INTERVAL
+        for index, monitor_ids in enumerate(by_url.values()):
+            for monitor_id in monitor_ids:
+                schedule_monitor(monitor_id, phase + index * spacing, replace=False)
+
+def _sync_leases():
+    """Heartbeat, drop monitors whose lease was lost and schedule newly claimed ones"""
+    with _leases_lock:
+        previously_held = set(_leased)
     with app.app_context():
-        active_monitors = ProductMonitor.query.filter_by(is_active=True).all()
-        for monitor in active_monitors:
-            start_monitoring_for_product(monitor.id)
-        logging.info(f"Started monitoring for {len(active_monitors)} active monitors")
+        try:
+            held, claimed = sync_leases(_worker_id)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to sync monitor leases for worker {_worker_id}: {str(e)}")
+            return
+        finally:
+            db.session.remove()
+
+    # Monitors claimed by start_monitoring_for_product meanwhile are kept
+    lost = previously_held - held
+    with _leases_lock:
+        _leased.difference_update(lost)
+        _leased.update(held)
+    for monitor_id in lost:
+        unschedule_monitor(monitor_id)
+    if lost:
+        forget_latest_states()
+    _schedule_claimed(claimed)
+    if claimed or lost:
+        logging.info(f"Worker {_worker_id} claimed {len(claimed)} and dropped {len(lost)} monitors, holding {len(held)}")
+
+def log_monitoring_stats():
+    """Log this process's counters, one line per kind"""
+    fetches = get_fetch_stats()
+    logging.info(
+        f"Fetch stats for worker {_worker_id}: "
+        f"{fetches['fetches']} fetches, {fetches['fetches_saved']} saved by URL sharing, "
+        f"{fetches['not_modified']} not modified, {fetches['parses_skipped']} parses skipped"
+    )
+    intervals = get_interval_stats()
+    logging.info(
+        f"Interval stats for worker {_worker_id}: "
+        f"{intervals['checks']} checks, {intervals['checks_avoided']:.0f} avoided by adaptive intervals "
+        f"({intervals['shortened']} shortened, {intervals['lengthened']} lengthened)"
+    )
+    digests = get_digest_stats()
+    logging.info(f"Digest stats for worker {_worker_id}: "
+                 f"{digests['alerts']} alerts sent as {digests['messages']} messages")
+    price_cache = get_price_cache_stats()
+    logging.info(f"Price cache stats for worker {_worker_id}: "
+                 f"{price_cache['hits']} hits, {price_cache['misses']} misses, {price_cache['size']} cached")
+    hosts = get_host_stats()
+    backing_off = sum(1 for state in hosts.values() if state['blocked_for'] > 0)
+    logging.info(f"Rate limiter stats for worker {_worker_id}: {len(hosts)} hosts, {backing_off} backing off")
+
+def _lease_loop():
+    next_stats = time.monotonic() + STATS_LOG_INTERVAL
+    while not _stopping.is_set():
+        _sync_leases()
+        if time.monotonic() >= next_stats:
+            log_monitoring_stats()
+            next_stats = time.monotonic() + STATS_LOG_INTERVAL
+        _stopping.wait(HEARTBEAT_INTERVAL)
+
+def start_monitoring():
+    """
+    Make this process a monitoring worker
+    It claims a share of the active monitors through the lease table, so any number
+    of processes (web or `python -m monitoring worker`) can run without checking a
+    monitor twice, and takes over monitors from workers that stop heartbeating
+    """
+    global _worker_id, _lease_thread, _exit_hook_registered
+    with _leases_lock:
+        if _lease_thread is not None and _lease_thread.is_alive():
+            return
+        _worker_id = _worker_id or new_worker_id()
+        _stopping.clear()
+        _lease_thread = threading.Thread(target=_lease_loop, name='monitor-leases', daemon=True)
+        _lease_thread.start()
+        if not _exit_hook_registered:
+            # Web servers stop their workers by exiting; hand monitors and alerts over then too
+            atexit.register(stop_monitoring)
+            _exit_hook_registered = True
+    start_price_rollups(_worker_id)
+    logging.info(f"Monitoring worker {_worker_id} started")
+
+def _wait_for_checks(timeout):
+    """Wait until no check is running; returns False if some still are after timeout seconds"""
+    deadline = time.monotonic() + timeout
+    with _schedule_cond:
+        while _in_flight:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _schedule_cond.wait(remaining)
+    return True
+
+def stop_monitoring():
+    """
+    Stop checking and hand this worker's monitors back
+    Running checks get STOP_TIMEOUT seconds to finish, then alerts waiting for their
+    digest window and the dispatch queue are sent and buffered results written before
+    the leases are released. Safe to call more than once
+    """
+    global _lease_thread
+    with _stop_lock:
+        if _lease_thread is None:
+            return
+        _stopping.set()
+        # Make sure no lease sync schedules more monitors after this point
+        _lease_thread.join(HEARTBEAT_INTERVAL)
+        _lease_thread = None
+        with _leases_lock:
+            leased = list(_leased)
+            _leased.clear()
+        for monitor_id in leased:
+            unschedule_monitor(monitor_id)
+
+        if not _wait_for_checks(STOP_TIMEOUT):
+            logging.warning(f"Monitoring worker {_worker_id} stopping with checks still running")
+        # Alerts waiting for their digest window go out now rather than being lost
+        digests = flush_digests()
+        drain_notifications()
+        flush_results()
+        log_monitoring_stats()
+        with app.app_context():
+            try:
+                retire_worker(_worker_id)
+            except Exception as e:
+                logging.error(f"Failed to release leases of worker {_worker_id}: {str(e)}")
+            finally:
+                db.session.remove()
+        logging.info(f"Monitoring worker {_worker_id} stopped, released {len(leased)} monitors "
+                     f"and sent {digests} pending digests")
+
+def run_worker():
+    """Run monitoring in the foreground until interrupted or terminated"""
+    signal.signal(signal.SIGTERM, lambda signum, frame: _stopping.set())
+    start_monitoring()
+    try:
+        while not _stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    stop_monitoring()
 
-# Start monitoring when module is imported
-start_all_active_monitoring()
+if __name__ == '__main__':
+    # Run the imported module rather than this __main__ copy, so the scheduler state
+    # is shared with the modules (routes, app) that import `monitoring`
+    import monitoring
+    if sys.argv[1:] != ['worker']:
+        sys.exit("usage: python -m monitoring worker")
+    monitoring.run_worker()
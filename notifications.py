@@ -3,7 +3,9 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
 import logging
+import threading
 
 # Email configuration
 SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
@@ -16,26 +18,43 @@ TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID", "")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN", "")
 TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER", "")
 
+SMTP_USE_TLS = os.environ.get("SMTP_USE_TLS", "true").lower() != "false"
+
+def email_configured():
+    """Check whether SMTP credentials are set"""
+    return bool(SMTP_USERNAME and SMTP_PASSWORD)
+
+def build_email_message(to_email, subject, message):
+    """Build the MIME message for a plain text notification email"""
+    msg = MIMEMultipart()
+    msg['From'] = SMTP_USERNAME
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    
+    # Add body to email
+    msg.attach(MIMEText(message, 'plain'))
+    return msg
+
+def open_smtp_connection():
+    """Open an authenticated SMTP session"""
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+    if SMTP_USE_TLS:
+        server.starttls()  # Enable security
+    server.login(SMTP_USERNAME, SMTP_PASSWORD)
+    return server
+
 def send_email_notification(to_email, subject, message):
     """Send email notification"""
     try:
-        if not SMTP_USERNAME or not SMTP_PASSWORD:
+        if not email_configured():
             logging.error("Email credentials not configured")
             return False
         
         # Create message
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_USERNAME
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Add body to email
-        msg.attach(MIMEText(message, 'plain'))
+        msg = build_email_message(to_email, subject, message)
         
         # Create SMTP session
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()  # Enable security
-        server.login(SMTP_USERNAME, SMTP_PASSWORD)
+        server = open_smtp_connection()
         
         # Send email
         text = msg.as_string()
@@ -49,86 +68,148 @@ def send_email_notification(to_email, subject, message):
         logging.error(f"Failed to send email to {to_email}: {str(e)}")
         return False
 
+# Twilio error codes meaning the sender/recipient format in use is wrong, so the
+# cached known-good format must be rediscovered
+WHATSAPP_FORMAT_ERROR_CODES = {21910, 63007, 21212, 21606}
+# Twilio error codes about one recipient's number; they say nothing about the format
+# and neither another format nor a retry will help
+WHATSAPP_RECIPIENT_ERROR_CODES = {21211, 63003}
+
+_twilio_client = None
+_whatsapp_format_index = None  # Index into whatsapp_formats() of the last format that worked
+_whatsapp_lock = threading.Lock()
+
+def whatsapp_configured():
+    """Check whether Twilio credentials are set"""
+    return bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER)
+
+def get_twilio_client():
+    """Return the long-lived Twilio client"""
+    global _twilio_client
+    with _whatsapp_lock:
+        if _twilio_client is None:
+            _twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        return _twilio_client
+
+def whatsapp_formats(to_phone):
+    """Candidate (from, to) address pairs for a WhatsApp message, in the order to try them"""
+    # Clean phone numbers
+    to_phone_clean = to_phone.replace('+', '').replace('-', '').replace(' ', '').replace('(', '').replace(')', '')
+    from_phone_clean = TWILIO_PHONE_NUMBER.replace('+', '').replace('-', '').replace(' ', '').replace('(', '').replace(')', '')
+    
+    # Ensure proper formatting for international numbers
+    if not to_phone_clean.startswith('1') and len(to_phone_clean) == 10:
+        to_phone_clean = '1' + to_phone_clean  # Add US country code if missing
+    if not from_phone_clean.startswith('1') and len(from_phone_clean) == 10:
+        from_phone_clean = '1' + from_phone_clean
+    
+    # For Twilio WhatsApp, the from number needs to be exactly as configured in Twilio
+    return [
+        # Twilio WhatsApp Sandbox number (most common)
+        ('whatsapp:+14155238886', f'whatsapp:+{to_phone_clean}'),
+        # User's configured WhatsApp number
+        (f'whatsapp:+{from_phone_clean}', f'whatsapp:+{to_phone_clean}'),
+        # Alternative sandbox numbers
+        ('whatsapp:+15017122661', f'whatsapp:+{to_phone_clean}'),
+        # Direct format with user's number
+        (TWILIO_PHONE_NUMBER, f'whatsapp:+{to_phone_clean}'),
+    ]
+
+def whatsapp_error_code(error):
+    """Return the Twilio error code of an exception, or None if it isn't a Twilio API error"""
+    return error.code if isinstance(error, TwilioRestException) else None
+
+def is_whatsapp_format_error(error):
+    """Check whether an error means the from/to format is wrong (retrying it won't help)"""
+    return whatsapp_error_code(error) in WHATSAPP_FORMAT_ERROR_CODES
+
+def is_whatsapp_permanent_error(error):
+    """Check whether retrying a failed WhatsApp message can't help"""
+    code = whatsapp_error_code(error)
+    return code in WHATSAPP_FORMAT_ERROR_CODES or code in WHATSAPP_RECIPIENT_ERROR_CODES
+
+def deliver_whatsapp(to_phone, message):
+    """
+    Send a WhatsApp message via Twilio, raising on failure
+    The last format that worked is tried first; the other formats are only tried
+    when Twilio rejects it with a format-related error code
+    """
+    global _whatsapp_format_index
+    client = get_twilio_client()
+    formats = whatsapp_formats(to_phone)
+    known_good = _whatsapp_format_index
+    order = list(range(len(formats)))
+    if known_good is not None:
+        order.remove(known_good)
+        order.insert(0, known_good)
+    
+    last_error = None
+    for index in order:
+        from_format, to_format = formats[index]
+        try:
+            message_obj = client.messages.create(
+                body=message,
+                from_=from_format,
+                to=to_format
+            )
+            _whatsapp_format_index = index
+            logging.info(f"WhatsApp message sent successfully. SID: {message_obj.sid}")
+            return message_obj.sid
+        except Exception as format_error:
+            last_error = format_error
+            if not is_whatsapp_format_error(format_error):
+                # Network/auth problems and bad recipient numbers aren't fixed by another format
+                break
+            if index == known_good:
+                logging.info("Cached WhatsApp format rejected, rediscovering")
+                _whatsapp_format_index = None
+            continue
+    
+    raise last_error
+
+def log_whatsapp_failure(error):
+    """Explain a WhatsApp failure, with setup hints for common misconfigurations"""
+    code = whatsapp_error_code(error)
+    if code == 63007:
+        logging.warning("WhatsApp sandbox not configured. To enable WhatsApp notifications:")
+        logging.warning("1. Go to Twilio Console > Messaging > Try it out > Send a WhatsApp message")
+        logging.warning("2. Follow the sandbox setup instructions")
+        logging.warning("3. Add your phone number to the sandbox")
+    elif code == 21910:
+        logging.warning("WhatsApp channel mismatch. Make sure TWILIO_PHONE_NUMBER is your WhatsApp-enabled number")
+    else:
+        logging.warning(f"WhatsApp notification failed: {str(error)}")
+
 def send_whatsapp_notification(to_phone, message):
     """Send WhatsApp notification via Twilio"""
     try:
-        if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN or not TWILIO_PHONE_NUMBER:
+        if not whatsapp_configured():
             logging.warning("Twilio credentials not configured - skipping WhatsApp notification")
             return False
         
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        
-        # Clean phone numbers
-        to_phone_clean = to_phone.replace('+', '').replace('-', '').replace(' ', '').replace('(', '').replace(')', '')
-        from_phone_clean = TWILIO_PHONE_NUMBER.replace('+', '').replace('-', '').replace(' ', '').replace('(', '').replace(')', '')
-        
-        # Ensure proper formatting for international numbers
-        if not to_phone_clean.startswith('1') and len(to_phone_clean) == 10:
-            to_phone_clean = '1' + to_phone_clean  # Add US country code if missing
-        if not from_phone_clean.startswith('1') and len(from_phone_clean) == 10:
-            from_phone_clean = '1' + from_phone_clean
-        
-        # For Twilio WhatsApp, the from number needs to be exactly as configured in Twilio
-        # Try different formats to find the working one
-        formats_to_try = [
-            # Twilio WhatsApp Sandbox number (most common)
-            ('whatsapp:+14155238886', f'whatsapp:+{to_phone_clean}'),
-            # User's configured WhatsApp number
-            (f'whatsapp:+{from_phone_clean}', f'whatsapp:+{to_phone_clean}'),
-            # Alternative sandbox numbers
-            ('whatsapp:+15017122661', f'whatsapp:+{to_phone_clean}'),
-            # Direct format with user's number
-            (TWILIO_PHONE_NUMBER, f'whatsapp:+{to_phone_clean}'),
-        ]
-        
-        last_error = None
-        for from_format, to_format in formats_to_try:
-            try:
-                message_obj = client.messages.create(
-                    body=message,
-                    from_=from_format,
-                    to=to_format
-                )
-                logging.info(f"WhatsApp message sent successfully. SID: {message_obj.sid}")
-                return True
-            except Exception as format_error:
-                last_error = format_error
-                continue
-        
-        # If all formats failed, log the last error
-        raise last_error
+        deliver_whatsapp(to_phone, message)
+        return True
         
     except Exception as e:
-        error_str = str(e)
-        if "63007" in error_str:
-            logging.warning("WhatsApp sandbox not configured. To enable WhatsApp notifications:")
-            logging.warning("1. Go to Twilio Console > Messaging > Try it out > Send a WhatsApp message")
-            logging.warning("2. Follow the sandbox setup instructions")
-            logging.warning("3. Add your phone number to the sandbox")
-        elif "21910" in error_str:
-            logging.warning("WhatsApp channel mismatch. Make sure TWILIO_PHONE_NUMBER is your WhatsApp-enabled number")
-        else:
-            logging.warning(f"WhatsApp notification failed: {error_str}")
+        log_whatsapp_failure(e)
         return False
 
-def send_monitoring_confirmation(email, phone_number, product_name, conditions, notification_pref):
-    """Send confirmation message when monitoring starts"""
-    try:
-        # Create conditions summary
-        conditions_list = []
-        if conditions.get('check_stock'):
-            conditions_list.append("Stock availability")
-        if conditions.get('check_size') and conditions.get('desired_size'):
-            conditions_list.append(f"Size: {conditions['desired_size']}")
-        if conditions.get('check_delivery'):
-            conditions_list.append("Delivery status")
-        if conditions.get('check_price') and conditions.get('target_price'):
-            conditions_list.append(f"Price drops below ₹{conditions['target_price']}")
-        
-        conditions_text = ", ".join(conditions_list) if conditions_list else "General monitoring"
-        
-        # Create confirmation message
-        message = f"""🛍️ ShopMate Monitoring Started!
+def monitoring_confirmation_message(product_name, conditions):
+    """Build the message confirming that monitoring started for a product"""
+    # Create conditions summary
+    conditions_list = []
+    if conditions.get('check_stock'):
+        conditions_list.append("Stock availability")
+    if conditions.get('check_size') and conditions.get('desired_size'):
+        conditions_list.append(f"Size: {conditions['desired_size']}")
+    if conditions.get('check_delivery'):
+        conditions_list.append("Delivery status")
+    if conditions.get('check_price') and conditions.get('target_price'):
+        conditions_list.append(f"Price drops below ₹{conditions['target_price']}")
+    
+    conditions_text = ", ".join(conditions_list) if conditions_list else "General monitoring"
+    
+    return f"""🛍️ ShopMate Monitoring Started!
 
 Product: {product_name}
 
@@ -138,6 +219,11 @@ We'll notify you as soon as your conditions are met. You can check your dashboar
 
 Happy shopping! 🎉"""
 
+def send_monitoring_confirmation(email, phone_number, product_name, conditions, notification_pref):
+    """Send confirmation message when monitoring starts"""
+    try:
+        message = monitoring_confirmation_message(product_name, conditions)
+
         # Send email confirmation
         email_sent = send_email_notification(
             email, 
@@ -154,57 +240,29 @@ Happy shopping! 🎉"""
                 logging.info("WhatsApp confirmation failed, but email should work")
         
         # Return True if at least email credentials exist, even if WhatsApp fails
-        return email_sent or (SMTP_USERNAME and SMTP_PASSWORD)
+        return email_sent or email_configured()
         
     except Exception as e:
         logging.error(f"Failed to send monitoring confirmation: {str(e)}")
         return False
 
 def send_notification(user, monitor, message):
-    """Send notification based on user preference"""
-    from app import db
-    from models import Notification
+    """
+    Send notification based on user preference
+    Alerts are coalesced into per-user digests and delivered in the background;
+    returns True once the alert is queued
+    """
+    from digest import queue_alert
     
     try:
-        subject = f"Product Alert: {monitor.product_name}"
-        
-        # Always send email
-        email_success = send_email_notification(user.email, subject, message)
-        
-        if email_success:
-            # Log email notification
-            email_notif = Notification(
-                monitor_id=monitor.id,
-                notification_type='email',
-                message=message,
-                status='sent'
-            )
-            db.session.add(email_notif)
-        
-        # Send WhatsApp if preference is set and phone number exists
-        whatsapp_success = True  # Default to True if WhatsApp not needed
-        if user.notification_preference == 'email_whatsapp' and user.phone_number:
-            whatsapp_success = send_whatsapp_notification(user.phone_number, message)
-            
-            # Log WhatsApp notification attempt
-            whatsapp_notif = Notification(
-                monitor_id=monitor.id,
-                notification_type='whatsapp',
-                message=message,
-                status='sent' if whatsapp_success else 'failed'
-            )
-            db.session.add(whatsapp_notif)
-            
-            if whatsapp_success:
-                logging.info(f"WhatsApp notification sent successfully for monitor {monitor.id}")
-            else:
-                logging.warning(f"WhatsApp notification failed for monitor {monitor.id}")
+        if not email_configured():
+            logging.error("Email credentials not configured")
+            return False
         
-        db.session.commit()
+        if user.notification_preference == 'email_whatsapp' and user.phone_number and not whatsapp_configured():
+            logging.warning("Twilio credentials not configured - skipping WhatsApp notification")
         
-        # Return True if email succeeded (WhatsApp failure shouldn't stop the notification process)
-        # But we still want to try WhatsApp if it's requested
-        return email_success
+        return queue_alert(user, monitor, message)
         
     except Exception as e:
         logging.error(f"Error sending notification: {str(e)}")
@@ -0,0 +1,8 @@
+# Entry module of the HTML parse processes (see scraper._get_parse_pool). It imports
+# nothing but the extractor, so the forkserver that preloads it, and every parse
+# process forked from that, stays clear of the app and its database
+from extractor import parse_html_fields
+
+def parse(html, profile, fields=None):
+    """Parse a page's fields inside a parse process; see extractor.parse_html_fields"""
+    return parse_html_fields(html, profile, fields)
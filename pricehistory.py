@@ -0,0 +1,219 @@
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app import app, db
+from models import PricePoint, PriceRollup
+from results import record_insert
+from snapshots import snapshot_key
+from leases import claim_job
+
+# Retention per resolution
+RAW_RETENTION = timedelta(hours=int(os.environ.get("PRICE_RAW_RETENTION_HOURS", "48")))
+HOURLY_RETENTION = timedelta(days=int(os.environ.get("PRICE_HOURLY_RETENTION_DAYS", "30")))
+DAILY_RETENTION = timedelta(days=int(os.environ.get("PRICE_DAILY_RETENTION_DAYS", "365")))
+ROLLUP_INTERVAL = 600  # Seconds between rollup/retention passes
+ROLLUP_JOB = 'price-rollup'  # Job lease held by the one worker that runs the passes
+ROLLUP_LEASE_TTL = 3 * ROLLUP_INTERVAL
+# Points are buffered (see results.py) and can reach the table well after their
+# recorded_at; a bucket is only rolled up once this much time has passed its end
+ROLLUP_DELAY = timedelta(minutes=5)
+
+RESOLUTIONS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1)
+}
+
+_rollup_thread = None
+_rollup_lock = threading.Lock()
+
+def record_price(url, price, recorded_at=None):
+    """Queue a numeric price observation for the next batched write"""
+    if price is None:
+        return
+    record_insert(PricePoint, {
+        'url_key': snapshot_key(url),
+        'recorded_at': recorded_at or datetime.utcnow(),
+        'price': float(price)
+    })
+
+def _bucket_start(moment, resolution):
+    if resolution == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _rollup(resolution, source_query, now):
+    """
+    Aggregate completed buckets after the newest existing rollup of this resolution,
+    leaving buckets that ended less than ROLLUP_DELAY ago for a later pass
+    source_query.rows(start, end) yields (url_key, timestamp, min, max, last, samples)
+    rows ordered by url_key, timestamp
+    """
+    step = RESOLUTIONS[resolution]
+    latest = db.session.query(func.max(PriceRollup.bucket_start)).filter_by(resolution=resolution).scalar()
+    end = _bucket_start(now - ROLLUP_DELAY, resolution)
+    start = latest + step if latest else None
+    if start is None:
+        earliest = source_query.earliest()
+        if earliest is None:
+            return 0
+        start = _bucket_start(earliest, resolution)
+
+    written = 0
+    while start < end:
+        buckets = {}
+        for url_key, _, low, high, last, samples in source_query.rows(start, start + step):
+            bucket = buckets.get(url_key)
+            if bucket is None:
+                buckets[url_key] = [low, high, last, samples]
+            else:
+                bucket[0] = min(bucket[0], low)
+                bucket[1] = max(bucket[1], high)
+                bucket[2] = last
+                bucket[3] += samples
+        if buckets:
+            db.session.execute(PriceRollup.__table__.insert(), [
+                {'url_key': url_key, 'resolution': resolution, 'bucket_start': start,
+                 'min_price': low, 'max_price': high, 'last_price': last, 'samples': samples}
+                for url_key, (low, high, last, samples) in buckets.items()
+            ])
+            db.session.commit()
+            written += len(buckets)
+        start += step
+    return written
+
+class _RawPoints:
+    """Raw price points as a rollup source"""
+
+    @staticmethod
+    def earliest():
+        return db.session.query(func.min(PricePoint.recorded_at)).scalar()
+
+    @staticmethod
+    def rows(start, end):
+        query = (db.session.query(PricePoint.url_key, PricePoint.recorded_at, PricePoint.price)
+                 .filter(PricePoint.recorded_at >= start, PricePoint.recorded_at < end)
+                 .order_by(PricePoint.url_key, PricePoint.recorded_at, PricePoint.id))
+        for url_key, recorded_at, price in query.yield_per(5000):
+            yield url_key, recorded_at, price, price, price, 1
+
+class _HourlyRollups:
+    """Hourly rollups as the source for daily rollups"""
+
+    @staticmethod
+    def earliest():
+        return db.session.query(func.min(PriceRollup.bucket_start)).filter_by(resolution='hour').scalar()
+
+    @staticmethod
+    def rows(start, end):
+        query = (db.session.query(PriceRollup.url_key, PriceRollup.bucket_start, PriceRollup.min_price,
+                                  PriceRollup.max_price, PriceRollup.last_price, PriceRollup.samples)
+                 .filter(PriceRollup.resolution == 'hour',
+                         PriceRollup.bucket_start >= start, PriceRollup.bucket_start < end)
+                 .order_by(PriceRollup.url_key, PriceRollup.bucket_start))
+        return query.yield_per(5000)
+
+def rollup_and_expire(now=None):
+    """Downsample raw points into hourly and daily rollups, then drop expired data"""
+    now = now or datetime.utcnow()
+    with _rollup_lock, app.app_context():
+        # Rollups and retention run in separate transactions so a failed rollup doesn't undo the deletes
+        try:
+            hourly = _rollup('hour', _RawPoints, now)
+            daily = _rollup('day', _HourlyRollups, now)
+            if hourly or daily:
+                logging.info(f"Rolled up {hourly} hourly and {daily} daily price buckets")
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Price rollup failed: {str(e)}")
+
+        try:
+            # Raw points are only dropped once their hour has been rolled up
+            rolled_until = db.session.query(func.max(PriceRollup.bucket_start)).filter_by(resolution='hour').scalar()
+            raw_cutoff = now - RAW_RETENTION
+            if rolled_until is not None:
+                raw_cutoff = min(raw_cutoff, rolled_until + RESOLUTIONS['hour'])
+                PricePoint.query.filter(PricePoint.recorded_at < raw_cutoff).delete(synchronize_session=False)
+            PriceRollup.query.filter(PriceRollup.resolution == 'hour',
+                                     PriceRollup.bucket_start < now - HOURLY_RETENTION).delete(synchronize_session=False)
+            PriceRollup.query.filter(PriceRollup.resolution == 'day',
+                                     PriceRollup.bucket_start < now - DAILY_RETENTION).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Price retention failed: {str(e)}")
+        finally:
+            db.session.remove()
+
+def _holds_rollup_job(worker_id):
+    """Take or renew the rollup job lease; only its holder runs rollup passes"""
+    with app.app_context():
+        try:
+            return claim_job(worker_id, ROLLUP_JOB, ROLLUP_LEASE_TTL)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to claim the price rollup job: {str(e)}")
+            return False
+        finally:
+            db.session.remove()
+
+def _rollup_loop(worker_id):
+    while True:
+        time.sleep(ROLLUP_INTERVAL)
+        if _holds_rollup_job(worker_id):
+            rollup_and_expire()
+
+def start_price_rollups(worker_id):
+    """
+    Start the background rollup/retention thread of a monitoring worker
+    Every worker runs one, but only the holder of the rollup job lease does any work
+    """
+    global _rollup_thread
+    if _rollup_thread is None or not _rollup_thread.is_alive():
+        _rollup_thread = threading.Thread(target=_rollup_loop, args=(worker_id,), name='price-rollup', daemon=True)
+        _rollup_thread.start()
+
+def price_series(urls, days=7):
+    """
+    Return price history for many URLs in a few queries, for sparklines and charts
+    Hourly 'last' prices cover the range, with raw points for the hours not yet rolled up
+    Returns dict of snapshot_key(url) -> list of (timestamp, price) oldest first
+    """
+    series = {snapshot_key(url): [] for url in urls}
+    if not series:
+        return series
+
+    since = datetime.utcnow() - timedelta(days=days)
+    rollups = (db.session.query(PriceRollup.url_key, PriceRollup.bucket_start, PriceRollup.last_price)
+               .filter(PriceRollup.url_key.in_(series.keys()), PriceRollup.resolution == 'hour',
+                       PriceRollup.bucket_start >= since)
+               .order_by(PriceRollup.bucket_start)
+               .all())
+    for url_key, bucket_start, price in rollups:
+        series[url_key].append((bucket_start, price))
+
+    # Rollups are written for all products at once, so one watermark splits rolled and raw data
+    rolled_until = db.session.query(func.max(PriceRollup.bucket_start)).filter_by(resolution='hour').scalar()
+    raw_since = max(since, rolled_until + RESOLUTIONS['hour']) if rolled_until else since
+    raw = (db.session.query(PricePoint.url_key, PricePoint.recorded_at, PricePoint.price)
+           .filter(PricePoint.url_key.in_(series.keys()), PricePoint.recorded_at >= raw_since)
+           .order_by(PricePoint.recorded_at)
+           .all())
+    for url_key, recorded_at, price in raw:
+        series[url_key].append((recorded_at, price))
+    return series
+
+def sparkline_points(series, width=120, height=24):
+    """Scale (timestamp, price) pairs to an SVG polyline points string"""
+    if len(series) < 2:
+        return None
+    prices = [price for _, price in series]
+    low, high = min(prices), max(prices)
+    span = (high - low) or 1
+    step = width / (len(prices) - 1)
+    return ' '.join(
+        f"{index * step:.1f},{height - (price - low) / span * height:.1f}"
+        for index, price in enumerate(prices)
+    )
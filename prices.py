@@ -0,0 +1,157 @@
+import os
+import re
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+# Parsed prices are memoized by raw text, since the same strings recur every check
+PRICE_CACHE_SIZE = int(os.environ.get("PRICE_CACHE_SIZE", "4096"))
+
+# Symbols and prefixes in the order they must be tried (longest first)
+CURRENCY_SYMBOLS = {
+    'US$': 'USD',
+    'CA$': 'CAD',
+    'AU$': 'AUD',
+    'NZ$': 'NZD',
+    'HK$': 'HKD',
+    'C$': 'CAD',
+    'A$': 'AUD',
+    'S$': 'SGD',
+    'R$': 'BRL',
+    'zł': 'PLN',
+    '$': 'USD',
+    '£': 'GBP',
+    '€': 'EUR',
+    '¥': 'JPY',
+    '₹': 'INR',
+    '₩': 'KRW',
+    '₽': 'RUB',
+    '₺': 'TRY'
+}
+CURRENCY_CODES = [
+    'USD', 'EUR', 'GBP', 'JPY', 'CNY', 'INR', 'CAD', 'AUD', 'NZD', 'CHF', 'SEK', 'NOK', 'DKK',
+    'PLN', 'CZK', 'HUF', 'BRL', 'MXN', 'KRW', 'RUB', 'TRY', 'HKD', 'SGD', 'ZAR'
+]
+
+_CURRENCY = (
+    r'(?:' + '|'.join(re.escape(symbol) for symbol in CURRENCY_SYMBOLS)
+    + r'|\b(?:' + '|'.join(CURRENCY_CODES) + r')(?![A-Za-z]))'
+)
+# Indian lakh/crore grouping (1,29,999 / 1,00,00,000), grouped thousands (1,299 / 1.299 /
+# 1'299 / non-breaking spaces), each with optional decimals, or a plain number
+_NUMBER = (
+    r"\d{1,3}(?:,\d{2})+,\d{3}(?:\.\d{1,2})?(?!\d)"
+    r"|\d{1,3}(?:[.,'\u00a0\u202f]\d{3})+(?:[.,]\d{1,2})?(?!\d)|\d+(?:[.,]\d{1,2})?(?!\d)"
+)
+
+def _amount_pattern(side):
+    """
+    Pattern for one currency amount, with named groups prefixed by side
+    A trailing symbol only counts when it doesn't start the next amount ("Size 10 $19")
+    """
+    return (
+        rf'(?:(?P<{side}_pre>{_CURRENCY})\s?(?P<{side}_num>{_NUMBER})'
+        rf'|(?P<{side}_bare>{_NUMBER})\s?(?P<{side}_post>{_CURRENCY})(?!\s?\d))'
+    )
+
+# A price, optionally followed by the upper end of a range ("$10 – $20", "10 to 20 €")
+PRICE_PATTERN = re.compile(
+    _amount_pattern('low')
+    + rf'(?:\s*(?:-|–|—|to)\s*(?:{_amount_pattern("high")}|(?P<high_plain>{_NUMBER})))?'
+)
+NUMBER_PATTERN = re.compile(_NUMBER)
+
+# Wording that marks a price as a former or reference price rather than the current one
+REFERENCE_PRICE_PREFIX = re.compile(
+    r'(?:was|rrp|msrp|list price|regular price|reg\.?|original price|originally|before|compare at|save)\s*:?\s*$',
+    re.IGNORECASE
+)
+REFERENCE_PRICE_SUFFIX = re.compile(r'^\s*(?:off|discount)\b', re.IGNORECASE)
+REFERENCE_CONTEXT = 24  # Characters around a price checked for reference wording
+
+def parse_amount(number):
+    """
+    Parse a number written with any common thousands/decimal separators into a Decimal
+    The last '.' or ',' is the decimal point unless it is followed by exactly three
+    digits, which makes it a thousands separator (1.299 -> 1299, 12,50 -> 12.50);
+    separators before it only group digits, so lakh grouping reads as one number too
+    (1,29,999 -> 129999)
+    """
+    digits = re.sub(r'[\'\u00a0\u202f]', '', number)
+    last = max(digits.rfind('.'), digits.rfind(','))
+    if last >= 0:
+        integer, fraction = digits[:last], digits[last + 1:]
+        if len(fraction) == 3 and integer.strip('0') != '':
+            digits = digits.replace('.', '').replace(',', '')
+        else:
+            digits = integer.replace('.', '').replace(',', '') + '.' + fraction
+    try:
+        return Decimal(digits)
+    except InvalidOperation:
+        return None
+
+def _currency(match, side):
+    """Return the ISO code for the currency written before or after one side of a match"""
+    symbol = match.group(f'{side}_pre') or match.group(f'{side}_post')
+    if not symbol:
+        return None
+    return CURRENCY_SYMBOLS.get(symbol, symbol)
+
+def _is_reference_price(text, match):
+    """Check whether a price is labelled as a was/list price or a discount"""
+    before = text[max(0, match.start() - REFERENCE_CONTEXT):match.start()]
+    after = text[match.end():match.end() + REFERENCE_CONTEXT]
+    return REFERENCE_PRICE_PREFIX.search(before) is not None or REFERENCE_PRICE_SUFFIX.search(after) is not None
+
+@lru_cache(maxsize=PRICE_CACHE_SIZE)
+def _select_price(text):
+    """
+    Find the current price in text
+    Returns (start, end, amount, currency) or None; ranges report their lower bound
+    and sale texts ("Was $30 Now $20") report the price that isn't a reference price
+    """
+    matches = list(PRICE_PATTERN.finditer(text))
+    if matches:
+        current = [match for match in matches if not _is_reference_price(text, match)]
+        match = (current or matches)[0]
+        amount = parse_amount(match.group('low_num') or match.group('low_bare'))
+        currency = _currency(match, 'low')
+        if currency is None and (match.group('high_pre') or match.group('high_post')):
+            currency = _currency(match, 'high')
+        return match.start(), match.end(), amount, currency
+
+    # No currency anywhere: fall back to the first bare number
+    match = NUMBER_PATTERN.search(text)
+    if match:
+        return match.start(), match.end(), parse_amount(match.group()), None
+    return None
+
+def parse_price(text):
+    """
+    Parse price text into (Decimal amount, ISO currency code or None)
+    Returns None when the text holds no price
+    """
+    if not text:
+        return None
+    selected = _select_price(text)
+    if selected is None or selected[2] is None:
+        return None
+    return selected[2], selected[3]
+
+def price_amount(text):
+    """Return the current price in text as a float, or None"""
+    parsed = parse_price(text)
+    return float(parsed[0]) if parsed else None
+
+def find_price(text):
+    """Return the part of text that holds the current price (or price range), or None"""
+    if not text:
+        return None
+    selected = _select_price(text)
+    if selected is None or selected[3] is None:
+        return None
+    return text[selected[0]:selected[1]].strip()
+
+def get_price_cache_stats():
+    """Return hit/miss counts of the parsed price cache"""
+    info = _select_price.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize}
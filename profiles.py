@@ -0,0 +1,69 @@
+import json
+import threading
+import logging
+from ratelimit import host_key
+
+# Learned per-host extraction profiles: host -> {field: [selectors]}
+_profiles = {}
+_profiles_loaded = False
+_profiles_lock = threading.Lock()
+
+def _load_profiles():
+    """Load every stored profile into memory on first use"""
+    global _profiles_loaded
+    from app import app
+    from models import ExtractionProfile
+
+    try:
+        with app.app_context():
+            for row in ExtractionProfile.query.all():
+                try:
+                    _profiles[row.host] = json.loads(row.selectors)
+                except ValueError:
+                    logging.warning(f"Ignoring malformed extraction profile for {row.host}")
+    except Exception as e:
+        logging.error(f"Failed to load extraction profiles: {str(e)}")
+    _profiles_loaded = True
+
+def get_profile(url):
+    """Return the remembered selectors for a URL's host (empty dict if none)"""
+    with _profiles_lock:
+        if not _profiles_loaded:
+            _load_profiles()
+        return _profiles.get(host_key(url), {})
+
+def record_profile(url, used):
+    """
+    Remember which selectors produced each field for a URL's host
+    Fields that produced nothing keep their previous selectors; the profile is
+    only written to the database when it actually changes
+    """
+    host = host_key(url)
+    if not host or not used:
+        return
+
+    with _profiles_lock:
+        current = _profiles.get(host, {})
+        updated = dict(current, **used)
+        if updated == current:
+            return
+        _profiles[host] = updated
+
+    _save_profile(host, updated)
+
+def _save_profile(host, selectors):
+    """Persist one host's profile"""
+    from app import app, db
+    from models import ExtractionProfile
+
+    try:
+        with app.app_context():
+            profile = ExtractionProfile.query.filter_by(host=host).first()
+            if profile:
+                profile.selectors = json.dumps(selectors)
+            else:
+                db.session.add(ExtractionProfile(host=host, selectors=json.dumps(selectors)))
+            db.session.commit()
+            logging.info(f"Updated extraction profile for {host}")
+    except Exception as e:
+        logging.error(f"Failed to save extraction profile for {host}: {str(e)}")
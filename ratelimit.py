@@ -0,0 +1,210 @@
+import os
+import time
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from sqlalchemy.exc import IntegrityError
+
+# Per-host politeness configuration (requests per second)
+DEFAULT_HOST_RATE = float(os.environ.get("HOST_RATE_LIMIT", "2"))
+MIN_HOST_RATE = 0.05
+MAX_HOST_RATE = float(os.environ.get("HOST_RATE_LIMIT_MAX", "10"))
+HOST_BURST = 4  # Tokens a quiet host can accumulate
+RATE_INCREASE_STEP = 0.05  # Added to a host's rate after each successful response
+MAX_BACKOFF = 900
+MAX_WAIT = 10  # Longest a fetch will wait for a token before giving up
+# Worker processes take each host's requests from one budget in the database, so the
+# host's rate holds however many of them fetch from it; off, each process has its own
+SHARED_HOST_BUDGET = os.environ.get("SHARED_HOST_BUDGET", "1") == "1"
+SHARED_BUDGET_ATTEMPTS = 5  # Tries at taking a shared slot before waiting as if none was free
+
+THROTTLE_STATUSES = {429, 503}
+
+class RateLimited(Exception):
+    """Raised when a host is backing off for longer than a fetch is willing to wait"""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host} is rate limited for another {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+class _HostBucket:
+    """Token bucket with AIMD rate adaptation and a backoff deadline for one host"""
+
+    def __init__(self):
+        self.rate = DEFAULT_HOST_RATE
+        self.tokens = HOST_BURST
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+
+    def refill(self, now):
+        self.tokens = min(HOST_BURST, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def host_key(url):
+    """Return the host a URL is rate limited (and its extraction profile stored) under"""
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+def _bucket(host):
+    bucket = _buckets.get(host)
+    if bucket is None:
+        bucket = _buckets[host] = _HostBucket()
+    return bucket
+
+def acquire(url, max_wait=MAX_WAIT):
+    """
+    Wait for a request slot on the URL's host, taken from the budget all workers
+    share unless SHARED_HOST_BUDGET is off
+    Raises RateLimited if the host won't have a slot within max_wait seconds
+    """
+    host = host_key(url)
+    deadline = time.monotonic() + max_wait
+    while True:
+        with _buckets_lock:
+            bucket = _bucket(host)
+            now = time.monotonic()
+            bucket.refill(now)
+            rate = bucket.rate
+            if now < bucket.blocked_until:
+                wait = bucket.blocked_until - now
+            elif SHARED_HOST_BUDGET:
+                wait = None
+            elif bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return
+            else:
+                wait = (1 - bucket.tokens) / bucket.rate
+
+        if wait is None:
+            wait = _take_shared_slot(host, rate)
+            if not wait:
+                return
+        if now + wait > deadline:
+            raise RateLimited(host, wait)
+        time.sleep(wait)
+
+def _take_shared_slot(host, rate):
+    """
+    Take one request from the host's budget shared by all workers (see HostBudget)
+    The row is only updated if nobody else changed it since it was read, so racing
+    workers can't take the same slot. Returns 0 when a slot was taken, otherwise
+    the seconds until one is free
+    """
+    from app import app, db
+    from models import HostBudget
+
+    interval = 1 / rate
+    try:
+        with app.app_context():
+            try:
+                for _ in range(SHARED_BUDGET_ATTEMPTS):
+                    now = time.time()
+                    budget = db.session.get(HostBudget, host)
+                    if budget is None:
+                        try:
+                            db.session.add(HostBudget(host=host, next_at=now + interval, blocked_until=0.0))
+                            db.session.commit()
+                            return 0
+                        except IntegrityError:
+                            db.session.rollback()
+                            continue
+                    if budget.blocked_until > now:
+                        return budget.blocked_until - now
+                    due = max(budget.next_at, now)
+                    ahead = due - now - (HOST_BURST - 1) * interval
+                    if ahead > 0:
+                        return ahead
+                    taken = (HostBudget.query.filter_by(host=host, next_at=budget.next_at)
+                             .update({'next_at': due + interval}, synchronize_session=False))
+                    db.session.commit()
+                    if taken:
+                        return 0
+                    db.session.expire_all()
+                return interval
+            finally:
+                db.session.remove()
+    except Exception as e:
+        # Fetching stays possible without the database; this process's own backoff still applies
+        logging.error(f"Failed to take a shared request slot for {host}: {str(e)}")
+        return 0
+
+def _block_shared(host, seconds):
+    """Hold every worker off a host for seconds, unless it is already blocked for longer"""
+    from app import app, db
+    from models import HostBudget
+
+    until = time.time() + seconds
+    try:
+        with app.app_context():
+            try:
+                blocked = (HostBudget.query.filter(HostBudget.host == host, HostBudget.blocked_until < until)
+                           .update({'blocked_until': until}, synchronize_session=False))
+                if not blocked and db.session.get(HostBudget, host) is None:
+                    db.session.add(HostBudget(host=host, next_at=time.time(), blocked_until=until))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+            finally:
+                db.session.remove()
+    except Exception as e:
+        logging.error(f"Failed to share the backoff for {host}: {str(e)}")
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds from now"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def report_response(url, status_code, retry_after=None):
+    """
+    Adapt a host's rate to the response it gave
+    Throttling responses halve the rate and block the host until Retry-After
+    (or an exponential backoff), for every worker when the budget is shared;
+    successes slowly raise the rate again
+    """
+    host = host_key(url)
+    backoff = None
+    with _buckets_lock:
+        bucket = _bucket(host)
+        if status_code in THROTTLE_STATUSES:
+            bucket.failures += 1
+            bucket.rate = max(MIN_HOST_RATE, bucket.rate / 2)
+            backoff = parse_retry_after(retry_after)
+            if backoff is None:
+                backoff = min(MAX_BACKOFF, 2 ** bucket.failures)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + backoff)
+            bucket.tokens = 0
+            logging.warning(f"{host} returned {status_code}, backing off {backoff:.0f}s at {bucket.rate:.2f} req/s")
+        elif status_code < 400:
+            bucket.failures = 0
+            bucket.rate = min(MAX_HOST_RATE, bucket.rate + RATE_INCREASE_STEP)
+    if backoff is not None and SHARED_HOST_BUDGET:
+        _block_shared(host, backoff)
+
+def host_rate(host):
+    """Return the request rate (per second) currently allowed for a host, as returned by host_key"""
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        return bucket.rate if bucket else DEFAULT_HOST_RATE
+
+def get_host_stats():
+    """Return current rate and backoff state for every host seen"""
+    now = time.monotonic()
+    with _buckets_lock:
+        return {
+            host: {'rate': bucket.rate, 'blocked_for': max(0.0, bucket.blocked_until - now)}
+            for host, bucket in _buckets.items()
+        }
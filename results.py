@@ -0,0 +1,184 @@
+import os
+import threading
+import logging
+from sqlalchemy import bindparam
+from app import app, db
+from models import ProductMonitor
+
+# Check results are buffered and written in bulk instead of one commit per check
+FLUSH_INTERVAL = float(os.environ.get("RESULT_FLUSH_INTERVAL", "2"))
+FLUSH_THRESHOLD = int(os.environ.get("RESULT_FLUSH_THRESHOLD", "500"))
+# A row can become visible this many seconds after its updated_at: the stamp is taken
+# before a slow write commits, and processes on different hosts disagree on the time
+RESULT_WRITE_LAG = 30
+# A row that keeps failing on its own is dropped after this many flushes, so it can't block the buffer
+MAX_WRITE_ATTEMPTS = int(os.environ.get("RESULT_MAX_WRITE_ATTEMPTS", "3"))
+
+# Columns a check result updates on its monitor
+RESULT_COLUMNS = [
+    'last_checked',
+    'last_status',
+    'product_name',
+    'product_price',
+    'check_interval',
+    'check_count',
+    'change_count',
+    'unchanged_streak',
+    'last_changed_at',
+    'last_state_hash'
+]
+
+# String columns are cut to their length; messages such as alerts run longer than last_status
+RESULT_COLUMN_LENGTHS = {
+    column: ProductMonitor.__table__.c[column].type.length for column in RESULT_COLUMNS
+    if getattr(ProductMonitor.__table__.c[column].type, 'length', None)
+}
+
+_pending_results = {}  # monitor_id -> {column: value}; a newer result replaces an older one
+_pending_inserts = []  # (model, {column: value}) rows appended by other stores
+_failed_attempts = {}  # id of a pending result or insert row -> flushes it failed in on its own
+_results_lock = threading.Lock()
+_flush_requested = threading.Event()
+_flush_lock = threading.Lock()
+_flush_thread = None
+
+def record_result(monitor):
+    """Queue a checked monitor's result columns for the next flush"""
+    values = {column: getattr(monitor, column) for column in RESULT_COLUMNS}
+    for column, length in RESULT_COLUMN_LENGTHS.items():
+        if isinstance(values[column], str):
+            values[column] = values[column][:length]
+    with _results_lock:
+        replaced = _pending_results.get(monitor.id)
+        if replaced is not None:
+            _failed_attempts.pop(id(replaced), None)
+        _pending_results[monitor.id] = values
+        pending = len(_pending_results)
+        _ensure_flusher_running()
+    if pending >= FLUSH_THRESHOLD:
+        _flush_requested.set()
+
+def record_insert(model, values):
+    """Queue a row to be inserted into model's table with the next flush"""
+    with _results_lock:
+        _pending_inserts.append((model, values))
+        pending = len(_pending_inserts)
+        _ensure_flusher_running()
+    if pending >= FLUSH_THRESHOLD:
+        _flush_requested.set()
+
+def flush_results():
+    """
+    Write every buffered result in one transaction; returns the number of monitors written
+    If the batch fails, rows are written one at a time so a bad row can't hold back
+    the others; rows that still fail are kept for the next flush, up to MAX_WRITE_ATTEMPTS
+    """
+    with _flush_lock:
+        with _results_lock:
+            results = _pending_results.copy()
+            inserts = list(_pending_inserts)
+            _pending_results.clear()
+            _pending_inserts.clear()
+
+        if not results and not inserts:
+            return 0
+
+        try:
+            with app.app_context():
+                try:
+                    _write_results(results)
+                    rows_by_model = {}
+                    for model, values in inserts:
+                        rows_by_model.setdefault(model, []).append(values)
+                    for model, rows in rows_by_model.items():
+                        db.session.execute(model.__table__.insert(), rows)
+                    db.session.commit()
+                    with _results_lock:
+                        for values in list(results.values()) + [values for _, values in inserts]:
+                            _failed_attempts.pop(id(values), None)
+                    return len(results)
+                except Exception as e:
+                    db.session.rollback()
+                    logging.warning(f"Failed to write {len(results)} check results and {len(inserts)} rows "
+                                    f"in one batch, writing them one at a time: {str(e)}")
+                failed_results, failed_inserts = _write_rows_singly(results, inserts)
+        finally:
+            with app.app_context():
+                db.session.remove()
+
+        written = len(results) - len(failed_results)
+        if written or len(inserts) > len(failed_inserts):
+            # Other rows went through, so these fail on their own rather than for lack of a database
+            failed_results = {monitor_id: values for monitor_id, values in failed_results.items()
+                              if _keep_failed(values, f"result of monitor {monitor_id}")}
+            failed_inserts = [(model, values) for model, values in failed_inserts
+                              if _keep_failed(values, f"{model.__tablename__} row")]
+        _requeue(failed_results, failed_inserts)
+        return written
+
+def _write_results(results):
+    """Execute the bulk UPDATE for buffered results (caller commits)"""
+    if not results:
+        return
+    table = ProductMonitor.__table__
+    statement = table.update().where(table.c.id == bindparam('monitor_id')).values(
+        **{column: bindparam(column) for column in RESULT_COLUMNS}
+    )
+    db.session.execute(statement, [dict(values, monitor_id=monitor_id) for monitor_id, values in results.items()])
+
+def _write_rows_singly(results, inserts):
+    """Write each result and row in its own transaction; returns the ones that failed"""
+    failed_results = {}
+    failed_inserts = []
+    for monitor_id, values in results.items():
+        try:
+            _write_results({monitor_id: values})
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to write check result of monitor {monitor_id}: {str(e)}")
+            failed_results[monitor_id] = values
+    for model, values in inserts:
+        try:
+            db.session.execute(model.__table__.insert(), [values])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to write {model.__tablename__} row: {str(e)}")
+            failed_inserts.append((model, values))
+    return failed_results, failed_inserts
+
+def _keep_failed(values, label):
+    """Count a failed write of one row; returns False once it should be dropped"""
+    with _results_lock:
+        attempts = _failed_attempts.get(id(values), 0) + 1
+        if attempts < MAX_WRITE_ATTEMPTS:
+            _failed_attempts[id(values)] = attempts
+            return True
+        _failed_attempts.pop(id(values), None)
+    logging.error(f"Dropping {label} after {attempts} failed writes: {values!r}")
+    return False
+
+def _requeue(results, inserts):
+    """Put failed rows back unless newer results arrived meanwhile"""
+    with _results_lock:
+        for monitor_id, values in results.items():
+            if monitor_id in _pending_results:
+                _failed_attempts.pop(id(values), None)
+            else:
+                _pending_results[monitor_id] = values
+        _pending_inserts[:0] = inserts
+
+def _flush_loop():
+    """Flush buffered results every FLUSH_INTERVAL, or sooner when the buffer fills up"""
+    while True:
+        _flush_requested.wait(FLUSH_INTERVAL)
+        _flush_requested.clear()
+        flush_results()
+
+def _ensure_flusher_running():
+    """Start the flush thread on first use (caller holds _results_lock)"""
+    global _flush_thread
+    if _flush_thread is None or not _flush_thread.is_alive():
+        _flush_thread = threading.Thread(target=_flush_loop, name='result-flusher', daemon=True)
+        _flush_thread.start()
@@ -1,10 +1,29 @@
-from flask import render_template, request, redirect, url_for, flash, session, jsonify
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, Response
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
 from app import app, db
 from models import User, ProductMonitor, Notification
-from scraper import scrape_product_info
-from monitoring import start_monitoring_for_product
+from monitor_setup import PENDING_STATUS, queue_monitor_setup
+from bulk_import import CONDITION_FIELDS, ImportFileError, import_monitors, parse_import_file
+from monitoring import stop_monitoring_for_product
+from snapshots import recent_changes, snapshot_key
+from pricehistory import price_series, sparkline_points
+from results import RESULT_WRITE_LAG
+from events import event_stream, monitor_status
 import logging
 
+# Snapshot fields shown as recent changes on the dashboard
+CHANGE_LABELS = {
+    'price': 'price',
+    'availability': 'stock',
+    'sizes': 'sizes',
+    'delivery': 'delivery'
+}
+
+# Updates commit a little after their updated_at, so status cursors look back this far
+STATUS_CURSOR_OVERLAP = timedelta(seconds=RESULT_WRITE_LAG)
+
 @app.route('/')
 def index():
     if 'user_id' not in session:
@@ -51,9 +70,98 @@ def dashboard():
         return redirect(url_for('login'))
     
     user = User.query.get(session['user_id'])
-    monitors = ProductMonitor.query.filter_by(user_id=user.id, is_active=True).all()
     
-    return render_template('dashboard.html', user=user, monitors=monitors)
+    # Monitors and their notification counts in one query, counted from the
+    # (monitor_id, sent_at) index rather than loading each monitor's notifications
+    notification_count = (select(func.count(Notification.id))
+                          .where(Notification.monitor_id == ProductMonitor.id)
+                          .correlate(ProductMonitor)
+                          .scalar_subquery())
+    rows = (db.session.query(ProductMonitor, notification_count)
+            .filter(ProductMonitor.user_id == user.id, ProductMonitor.is_active == True)
+            .all())
+    monitors = [monitor for monitor, _ in rows]
+    total_notifications = sum(count for _, count in rows)
+    
+    # What changed on each product in the last hour, from the snapshot history
+    url_keys = {monitor.id: snapshot_key(monitor.product_url) for monitor in monitors}
+    changes_by_key = recent_changes({monitor.product_url for monitor in monitors}, minutes=60)
+    recent = {}
+    for monitor in monitors:
+        changes = changes_by_key.get(url_keys[monitor.id])
+        if changes:
+            taken_at, fields = changes[-1]
+            labels = sorted(CHANGE_LABELS[field] for field in fields if field in CHANGE_LABELS)
+            if labels:
+                recent[monitor.id] = (taken_at, labels)
+    
+    # Price sparkline per card from the price history rollups
+    series_by_key = price_series({monitor.product_url for monitor in monitors}, days=7)
+    sparklines = {monitor.id: sparkline_points(series_by_key.get(url_keys[monitor.id], [])) for monitor in monitors}
+    
+    # The page's JS polls /api/monitors/status for changes after this
+    status_cursor = max((monitor.updated_at for monitor in monitors if monitor.updated_at), default=None)
+    
+    return render_template('dashboard.html', user=user, monitors=monitors, recent_changes=recent,
+                           sparklines=sparklines, total_notifications=total_notifications,
+                           status_cursor=status_cursor)
+
+@app.route('/api/monitors/status')
+def monitors_status():
+    """
+    Status of the current user's monitors that changed since ?since=<cursor>
+    Answers 304 while the ETag (a digest of the user's monitor state) is unchanged,
+    so an idle dashboard costs one aggregate query per poll
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    user_id = session['user_id']
+    
+    # updated_at moves on every write (check results, setup, stops), and the count on deletes
+    count, latest = (db.session.query(
+        func.count(ProductMonitor.id),
+        func.max(ProductMonitor.updated_at)
+    ).filter(ProductMonitor.user_id == user_id).one())
+    etag = hashlib.md5(f"{user_id}:{count}:{latest}".encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    query = ProductMonitor.query.filter(ProductMonitor.user_id == user_id)
+    since = request.args.get('since')
+    if since:
+        try:
+            # Overlap the cursor by the commit delay; patching a row twice is harmless
+            query = query.filter(ProductMonitor.updated_at > datetime.fromisoformat(since) - STATUS_CURSOR_OVERLAP)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    response = jsonify({
+        'cursor': latest.isoformat() if latest else None,
+        'monitors': [
+            monitor_status(monitor.id, monitor.is_active, monitor.last_checked,
+                           monitor.last_status, monitor.product_price, monitor.product_name)
+            for monitor in query.all()
+        ]
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/events')
+def events():
+    """
+    Server-Sent Events stream of the current user's monitor status changes and notifications
+    Each open stream holds a connection, so serve it from an async worker (gunicorn -k gevent)
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    response = Response(event_stream(session['user_id']), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop proxies buffering the stream
+    return response
 
 @app.route('/monitor', methods=['GET', 'POST'])
 def monitor():
@@ -105,35 +213,24 @@ def monitor():
             user.phone_number = phone_number
             user.notification_preference = notification_pref
             
-            # Scrape product info
-            product_info = scrape_product_info(product_url)
-            if not product_info:
-                flash('Unable to scrape product information. Please check the URL.', 'error')
-                return render_template('monitor.html', user=user)
-            
-            # Create monitor
+            # Create monitor; product details are filled in by the background setup
             monitor = ProductMonitor(
                 user_id=user.id,
                 product_url=product_url,
-                product_name=product_info.get('name', 'Unknown Product'),
-                product_price=product_info.get('price', 'N/A'),
                 check_stock=check_stock,
                 check_size=check_size,
                 desired_size=desired_size,
                 check_delivery=check_delivery,
                 check_price=check_price,
                 target_price=target_price,
-                last_status='Monitoring started'
+                last_status=PENDING_STATUS
             )
             
             db.session.add(monitor)
             db.session.commit()
             
-            # Start monitoring
-            start_monitoring_for_product(monitor.id)
-            
-            # Send confirmation message
-            from notifications import send_monitoring_confirmation
+            # Scrape the product, start monitoring and send the confirmation message
+            # without holding up the request
             conditions = {
                 'check_stock': check_stock,
                 'check_size': check_size,
@@ -143,15 +240,9 @@ def monitor():
                 'target_price': target_price
             }
             
-            confirmation_sent = send_monitoring_confirmation(
-                email, phone_number, monitor.product_name, conditions, notification_pref
-            )
+            queue_monitor_setup(monitor.id, email, phone_number, conditions, notification_pref)
             
-            # Show success message regardless of confirmation status
-            if confirmation_sent:
-                flash('Product monitoring started successfully! Confirmation sent to your email/WhatsApp.', 'success')
-            else:
-                flash('Product monitoring started successfully! Check your dashboard for status updates.', 'success')
+            flash('Product monitoring started! Product details will appear on your dashboard in a moment.', 'success')
             
             return redirect(url_for('dashboard'))
             
@@ -162,6 +253,74 @@ def monitor():
     
     return render_template('monitor.html', user=user)
 
+@app.route('/monitors/import', methods=['POST'])
+def import_monitors_upload():
+    """Create monitors from an uploaded CSV or JSON file"""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    user = User.query.get(session['user_id'])
+    upload = request.files.get('import_file')
+    if not upload or not upload.filename:
+        flash('Please choose a CSV or JSON file to import', 'error')
+        return redirect(url_for('monitor'))
+    
+    # Conditions ticked on the form apply to rows that don't set their own
+    defaults = {field: request.form.get(field) == 'on' for field in CONDITION_FIELDS}
+    defaults['desired_size'] = request.form.get('desired_size', '').strip()
+    defaults['target_price'] = request.form.get('target_price', '').strip()
+    
+    try:
+        rows = parse_import_file(upload.filename, upload.read())
+        result = import_monitors(user, rows, defaults)
+    except ImportFileError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('monitor'))
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error importing monitors: {str(e)}")
+        flash('An error occurred while importing monitors. Please try again.', 'error')
+        return redirect(url_for('monitor'))
+    
+    summary = f"Imported {len(result['created'])} monitors"
+    if result['duplicates']:
+        summary += f", skipped {len(result['duplicates'])} already watched"
+    if result['errors']:
+        first = result['errors'][0]
+        summary += f", {len(result['errors'])} rows had errors (row {first['row']}: {first['error']})"
+    flash(summary + '. Product details will appear on your dashboard as they are fetched.',
+          'success' if result['created'] else 'error')
+    return redirect(url_for('dashboard'))
+
+@app.route('/api/monitors/bulk', methods=['POST'])
+def import_monitors_api():
+    """
+    Create monitors from a JSON body: {"monitors": [{"product_url": ..., "check_stock": true, ...}], "defaults": {...}}
+    Responds with the created monitor ids, skipped duplicate URLs and per-row errors
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = User.query.get(session['user_id'])
+    payload = request.get_json(silent=True)
+    if isinstance(payload, list):
+        payload = {'monitors': payload}
+    if not isinstance(payload, dict) or not isinstance(payload.get('monitors'), list):
+        return jsonify({'error': 'Expected a JSON object with a "monitors" list'}), 400
+    if not all(isinstance(row, dict) for row in payload['monitors']):
+        return jsonify({'error': 'Each monitor must be a JSON object'}), 400
+    
+    try:
+        result = import_monitors(user, payload['monitors'], payload.get('defaults'))
+    except ImportFileError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error importing monitors: {str(e)}")
+        return jsonify({'error': 'Import failed'}), 500
+    
+    return jsonify(result), 201 if result['created'] else 200
+
 @app.route('/stop_monitor/<int:monitor_id>')
 def stop_monitor(monitor_id):
     if 'user_id' not in session:
@@ -171,6 +330,7 @@ def stop_monitor(monitor_id):
     if monitor:
         monitor.is_active = False
         db.session.commit()
+        stop_monitoring_for_product(monitor_id)
         flash('Monitoring stopped', 'info')
     else:
         flash('Monitor not found', 'error')
@@ -186,6 +346,7 @@ def delete_monitor(monitor_id):
     if monitor:
         db.session.delete(monitor)
         db.session.commit()
+        stop_monitoring_for_product(monitor_id)
         flash('Monitor deleted', 'info')
     else:
         flash('Monitor not found', 'error')
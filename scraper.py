@@ -1,175 +1,300 @@
-import requests
-from bs4 import BeautifulSoup
+import os
 import logging
 import re
-from urllib.parse import urlparse
+import multiprocessing
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from fetcher import fetch_page_body, fetch_many, is_transient_error
+from extractor import parse_html_fields
+import parse_worker
+from profiles import get_profile, record_profile
+from structured_data import extract_structured_product, missing_fields, structured_data_cutoff
+from prices import price_amount
+
+# Query parameters that only track where a visitor came from and never change the page
+# Only click and analytics trackers: generic names like ref, source or campaign
+# select the product or variant on some stores
+TRACKING_PARAMS = {
+    'gclid', 'gbraid', 'wbraid', 'fbclid', 'msclkid', 'dclid', 'yclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', 'srsltid'
+}
+TRACKING_PARAM_PREFIXES = ('utm_', 'pf_rd_', 'pd_rd_')
+
+# How long one scrape of a URL is shared with other monitors of the same product
+SHARED_RESULT_TTL = 240
+
+_shared_results = {}  # normalized url -> (fetched_at, product_info)
+_pending_scrapes = {}  # normalized url -> [threading.Event, product_info]
+_shared_lock = threading.Lock()
+fetch_stats = {'fetches': 0, 'fetches_saved': 0, 'not_modified': 0, 'parses_skipped': 0}
+
+def normalize_product_url(url):
+    """Normalize a product URL so that links to the same page compare equal"""
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parsed.port and parsed.port not in (80, 443):
+        host = f"{host}:{parsed.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    )
+    path = parsed.path.rstrip('/') or '/'
+    return urlunparse(('https' if parsed.scheme in ('http', 'https') else parsed.scheme, host, path, '', urlencode(query), ''))
+
+def get_shared_product_info(url, max_age=SHARED_RESULT_TTL):
+    """
+    Scrape a product URL at most once per max_age seconds across all monitors
+    Concurrent callers for the same normalized URL wait for a single fetch, and
+    get its error if the fetch failed transiently (see scrape_product_info)
+    """
+    key = normalize_product_url(url)
+    with _shared_lock:
+        cached = _shared_results.get(key)
+        if cached and time.monotonic() - cached[0] < min(max_age, SHARED_RESULT_TTL):
+            fetch_stats['fetches_saved'] += 1
+            return cached[1]
+        pending = _pending_scrapes.get(key)
+        if pending is None:
+            pending = _pending_scrapes[key] = [threading.Event(), None, None]
+            is_owner = True
+        else:
+            is_owner = False
+
+    if not is_owner:
+        # Another monitor of the same product is already fetching it
+        pending[0].wait()
+        with _shared_lock:
+            fetch_stats['fetches_saved'] += 1
+        if pending[2] is not None:
+            raise pending[2]
+        return pending[1]
+
+    product_info = None
+    try:
+        product_info = scrape_product_info(url)
+    except Exception as e:
+        pending[2] = e
+        raise
+    finally:
+        with _shared_lock:
+            fetch_stats['fetches'] += 1
+            if product_info:
+                _shared_results[key] = (time.monotonic(), product_info)
+                _prune_shared_results()
+            pending[1] = product_info
+            del _pending_scrapes[key]
+        pending[0].set()
+    return product_info
+
+def _prune_shared_results():
+    """Drop expired shared results (caller holds the lock)"""
+    if len(_shared_results) < 1024:
+        return
+    cutoff = time.monotonic() - SHARED_RESULT_TTL
+    for key in [key for key, (fetched_at, _) in _shared_results.items() if fetched_at < cutoff]:
+        del _shared_results[key]
+
+def _count_fetch_stat(name, count=1):
+    with _shared_lock:
+        fetch_stats[name] += count
+
+def record_fetches_saved(count):
+    """Count fetches avoided by callers that group monitors by URL themselves"""
+    if count > 0:
+        _count_fetch_stat('fetches_saved', count)
+
+def get_fetch_stats():
+    """Return fetch counters, including fetches saved by URL deduplication"""
+    with _shared_lock:
+        return dict(fetch_stats, cached_urls=len(_shared_results))
+
+# Per-URL validators from the last successful fetch, used for conditional requests
+MAX_PAGE_VALIDATORS = 10000
+_page_validators = OrderedDict()  # normalized url -> {'etag', 'last_modified', 'body_hash', 'product_info'}
+_validators_lock = threading.Lock()
+
+# Inline scripts (other than structured data) and comments often carry per-request
+# nonces and timestamps, so they are left out of the body hash
+VOLATILE_MARKUP_PATTERN = re.compile(
+    rb'<script(?![^>]*application/ld\+json)[^>]*>.*?</script>|<!--.*?-->',
+    re.IGNORECASE | re.DOTALL
+)
+
+def hash_page_body(html):
+    """Hash the parts of a page that can affect the extracted product info"""
+    return hashlib.blake2b(VOLATILE_MARKUP_PATTERN.sub(b'', html), digest_size=16).hexdigest()
 
 def scrape_product_info(url):
     """
     Scrape basic product information from a given URL
-    Returns dict with name, price, availability info
+    Sends the last ETag/Last-Modified and skips parsing when the page is unchanged
+    Returns dict with name, price, availability info, or None when the page can't be
+    scraped; raises the error when it may succeed later (see fetcher.is_transient_error),
+    such as RateLimited when the host has no request slot soon enough
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        key = normalize_product_url(url)
+        with _validators_lock:
+            previous = _page_validators.get(key)
+
+        headers = {}
+        if previous:
+            if previous['etag']:
+                headers['If-None-Match'] = previous['etag']
+            if previous['last_modified']:
+                headers['If-Modified-Since'] = previous['last_modified']
+
+        response, body = fetch_page_body(url, headers=headers, stop_at=_stop_after_structured_data())
+        if response.status_code == 304 and previous:
+            logging.debug(f"{url} not modified, reusing last product info")
+            _count_fetch_stat('not_modified')
+            return dict(previous['product_info'], url=url)
+
+        body_hash = hash_page_body(body)
+        if previous and previous['body_hash'] == body_hash:
+            product_info = dict(previous['product_info'], url=url)
+            _count_fetch_stat('parses_skipped')
+        else:
+            product_info = parse_product_page(body, url)
+
+        if product_info:
+            _remember_page(key, response, body_hash, product_info)
+        return product_info
+
+    except Exception as e:
+        if is_transient_error(e):
+            raise
+        logging.error(f"Error scraping {url}: {str(e)}")
+        return None
+
+def _stop_after_structured_data():
+    """
+    Build a stop_at callback for fetch_page_body that ends the download once the
+    JSON-LD blocks received so far describe a complete product
+    Pages without complete structured data are read up to the size cap: the HTML
+    heuristics match sold-out buttons and size lists anywhere in the page, and no
+    markup reliably ends a product section, so cutting the HTML short could turn
+    an out-of-stock product into an in-stock one
+    """
+    scanned = [0]
+
+    def stop_at(body):
+        if b'ld+json' not in body:
+            return None
+        cut, scanned[0] = structured_data_cutoff(body, scanned[0])
+        return cut
+
+    return stop_at
+
+def _remember_page(key, response, body_hash, product_info):
+    """Store validators and the parsed result for the next conditional fetch"""
+    with _validators_lock:
+        _page_validators[key] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'body_hash': body_hash,
+            'product_info': product_info
         }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Extract product name (common selectors)
-        name = None
-        name_selectors = [
-            'h1[data-testid="product-title"]',
-            'h1.product-title',
-            'h1#product-title',
-            '.product-name h1',
-            '.product-title',
-            'h1',
-            '.title h1',
-            '[data-cy="product-name"]'
-        ]
-        
-        for selector in name_selectors:
-            element = soup.select_one(selector)
-            if element:
-                name = element.get_text(strip=True)
-                break
-        
-        # Extract price (common selectors)
-        price = None
-        price_selectors = [
-            '.price',
-            '.product-price',
-            '[data-testid="price"]',
-            '.current-price',
-            '.sale-price',
-            '.regular-price',
-            '.price-current',
-            '[class*="price"]'
-        ]
-        
-        for selector in price_selectors:
-            element = soup.select_one(selector)
-            if element:
-                price_text = element.get_text(strip=True)
-                # Extract price with regex
-                price_match = re.search(r'[\$£€¥₹]\s*[\d,]+\.?\d*', price_text)
-                if price_match:
-                    price = price_match.group()
-                    break
-        
-        # Check availability (common indicators)
-        availability = check_availability(soup)
-        
-        # Check sizes available
-        sizes = extract_available_sizes(soup)
-        
-        # Check delivery info
-        delivery_info = extract_delivery_info(soup)
-        
+        _page_validators.move_to_end(key)
+        while len(_page_validators) > MAX_PAGE_VALIDATORS:
+            _page_validators.popitem(last=False)
+
+def scrape_many_product_info(urls):
+    """
+    Scrape several product URLs concurrently over the shared connection pool
+    Returns dict of url -> product info (None where scraping failed)
+    """
+    return fetch_many(urls, fetch=scrape_product_info)
+
+# HTML parsing is pure-Python CPU work, so it runs in worker processes instead of
+# holding the GIL against the fetch threads; 0 parses in the calling thread
+PARSE_PROCESSES = int(os.environ.get("PARSE_PROCESSES", str(os.cpu_count() or 1)))
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def _get_parse_pool():
+    """Start the parse process pool on first use"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # Forking this threaded process can deadlock the child, so parse processes
+            # come from a forkserver that only preloaded parse_worker (or are spawned).
+            # multiprocessing still imports the launching module into each of them as
+            # __mp_main__, so entry modules keep their startup behind a __name__ check
+            # (see main.py); under `python -m monitoring worker` that import loads the app
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['parse_worker'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_PROCESSES, mp_context=context)
+        return _parse_pool
+
+def _parse_fields(html, profile, fields=None):
+    """Run parse_html_fields in the parse pool, falling back to this thread if the pool broke"""
+    if PARSE_PROCESSES <= 0:
+        return parse_html_fields(html, profile, fields)
+
+    global _parse_pool
+    pool = _get_parse_pool()
+    try:
+        return pool.submit(parse_worker.parse, html, profile, fields).result()
+    except BrokenProcessPool:
+        logging.error("A parse process died, restarting the parse pool")
+        with _parse_pool_lock:
+            if _parse_pool is pool:
+                _parse_pool = None
+        pool.shutdown(wait=False)
+        return parse_html_fields(html, profile, fields)
+
+def parse_product_page(html, url):
+    """
+    Parse product information out of a downloaded page
+    Returns dict with name, price, availability info
+    """
+    try:
+        # Structured product data is cheaper and more reliable than the HTML heuristics,
+        # but fields it doesn't state still have to come from the HTML
+        structured = extract_structured_product(html)
+        missing = missing_fields(structured) if structured else None
+        if structured and not missing:
+            return dict(structured, url=url)
+
+        # Profiles are read and learned here; the parse process only gets a copy
+        fields, used = _parse_fields(html, get_profile(url), missing)
+        record_profile(url, used)
+
+        if structured:
+            return dict(structured, url=url, **{field: fields[field] for field in missing})
         return {
-            'name': name or 'Unknown Product',
-            'price': price or 'Price not found',
-            'availability': availability,
-            'sizes': sizes,
-            'delivery': delivery_info,
+            'name': fields['name'] or 'Unknown Product',
+            'price': fields['price'] or 'Price not found',
+            'availability': fields['availability'],
+            'sizes': fields['sizes'],
+            'delivery': fields['delivery'],
             'url': url
         }
-        
+
     except Exception as e:
-        logging.error(f"Error scraping {url}: {str(e)}")
+        logging.error(f"Error parsing {url}: {str(e)}")
         return None
 
-def check_availability(soup):
-    """Check if product is in stock"""
-    # Common out of stock indicators
-    out_of_stock_indicators = [
-        'out of stock',
-        'sold out',
-        'not available',
-        'unavailable',
-        'temporarily out of stock',
-        'currently unavailable'
-    ]
-    
-    # Check button text
-    buttons = soup.find_all(['button', 'input'])
-    for button in buttons:
-        text = button.get_text(strip=True).lower()
-        for indicator in out_of_stock_indicators:
-            if indicator in text:
-                return 'Out of Stock'
-    
-    # Check for availability messages
-    availability_selectors = [
-        '.availability',
-        '.stock-status',
-        '.product-availability',
-        '[data-testid="availability"]'
-    ]
-    
-    for selector in availability_selectors:
-        element = soup.select_one(selector)
-        if element:
-            text = element.get_text(strip=True).lower()
-            for indicator in out_of_stock_indicators:
-                if indicator in text:
-                    return 'Out of Stock'
-    
-    return 'In Stock'
-
-def extract_available_sizes(soup):
-    """Extract available sizes"""
-    sizes = []
-    
-    # Common size selectors
-    size_selectors = [
-        '.size-option',
-        '.size-selector option',
-        '.sizes button',
-        '[data-testid="size-option"]',
-        '.size-variant'
-    ]
-    
-    for selector in size_selectors:
-        elements = soup.select(selector)
-        for element in elements:
-            if element.name == 'option' and element.get('value'):
-                size = element.get('value')
-            else:
-                size = element.get_text(strip=True)
-            
-            if size and size not in sizes:
-                sizes.append(size)
-    
-    return sizes
-
-def extract_delivery_info(soup):
-    """Extract delivery information"""
-    delivery_selectors = [
-        '.delivery-info',
-        '.shipping-info',
-        '.delivery-options',
-        '[data-testid="delivery"]'
-    ]
-    
-    for selector in delivery_selectors:
-        element = soup.select_one(selector)
-        if element:
-            return element.get_text(strip=True)
-    
-    return 'Delivery info not found'
-
-def check_product_conditions(monitor):
+def check_product_conditions(monitor, product_info=None):
     """
     Check if current product state matches user's desired conditions
+    Uses the shared per-URL scrape unless product_info is passed in
     Returns (should_notify, message)
     """
     try:
-        product_info = scrape_product_info(monitor.product_url)
+        if product_info is None:
+            product_info = get_shared_product_info(monitor.product_url)
         if not product_info:
             return False, "Unable to check product"
         
@@ -209,11 +334,4 @@ def check_product_conditions(monitor):
 
 def extract_price_number(price_text):
     """Extract numeric price from price text"""
-    try:
-        # Remove currency symbols and extract number
-        price_match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', ''))
-        if price_match:
-            return float(price_match.group())
-    except:
-        pass
-    return None
+    return price_amount(price_text)
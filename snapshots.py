@@ -0,0 +1,138 @@
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from app import db
+from models import ProductSnapshot
+from results import record_insert
+from scraper import normalize_product_url
+from prices import price_amount
+
+KEYFRAME_EVERY = 20  # Deltas between full-state rows
+MAX_CACHED_STATES = 50000
+SNAPSHOT_FIELDS = ['price', 'price_text', 'availability', 'sizes', 'delivery']
+
+_latest_states = OrderedDict()  # url_key -> [state, deltas since the last keyframe]
+_states_lock = threading.Lock()
+# Snapshots of one product are taken one at a time, so concurrent checks of it can't
+# both diff against the same previous state; keys share a fixed set of locks
+_key_locks = [threading.Lock() for _ in range(64)]
+
+def snapshot_key(url):
+    """Return the key snapshots of a product URL are stored under"""
+    return hashlib.md5(normalize_product_url(url).encode('utf-8')).hexdigest()
+
+def product_state(product_info):
+    """Reduce scraped product info to the compact state that snapshots track"""
+    price_text = product_info.get('price')
+    return {
+        'price': price_amount(price_text or ''),
+        'price_text': price_text,
+        'availability': product_info.get('availability'),
+        'sizes': sorted(product_info.get('sizes') or []),
+        'delivery': product_info.get('delivery')
+    }
+
+def diff_states(old, new):
+    """Return {field: (old value, new value)} for every field that differs"""
+    old = old or {}
+    return {field: (old.get(field), new.get(field)) for field in SNAPSHOT_FIELDS if old.get(field) != new.get(field)}
+
+def _load_latest_state(url_key):
+    """Rebuild the latest stored state from the last keyframe and the deltas after it"""
+    keyframe = (ProductSnapshot.query
+                .filter_by(url_key=url_key, is_keyframe=True)
+                .order_by(ProductSnapshot.taken_at.desc(), ProductSnapshot.id.desc())
+                .first())
+    if keyframe is None:
+        return None, 0
+    deltas = (ProductSnapshot.query
+              .filter(ProductSnapshot.url_key == url_key, ProductSnapshot.id > keyframe.id)
+              .order_by(ProductSnapshot.id)
+              .all())
+    state = json.loads(keyframe.changes)
+    state.pop('_changed', None)
+    for delta in deltas:
+        state.update(json.loads(delta.changes))
+    return state, len(deltas)
+
+def record_snapshot(url, product_info, taken_at=None):
+    """
+    Append a product's state to its history if anything changed since the last snapshot
+    Must be called inside an app context. Returns the diff against the previous
+    state ({} when unchanged; every field on the first snapshot of a URL)
+    """
+    url_key = snapshot_key(url)
+    with _key_locks[int(url_key[:8], 16) % len(_key_locks)]:
+        return _record_state(url, url_key, product_state(product_info), taken_at)
+
+def _record_state(url, url_key, state, taken_at):
+    """Diff a state against the product's latest one and queue a snapshot (caller holds its key lock)"""
+    with _states_lock:
+        cached = _latest_states.get(url_key)
+    if cached is None:
+        try:
+            cached = list(_load_latest_state(url_key))
+        except Exception as e:
+            logging.error(f"Failed to load snapshot history for {url}: {str(e)}")
+            cached = [None, 0]
+
+    previous, deltas_since_keyframe = cached
+    changes = diff_states(previous, state)
+    if changes:
+        is_keyframe = previous is None or deltas_since_keyframe + 1 >= KEYFRAME_EVERY
+        if is_keyframe:
+            # Keyframes hold the full state plus which fields changed (none on a URL's first snapshot)
+            stored = dict(state, _changed=sorted(changes) if previous is not None else [])
+        else:
+            stored = {field: state[field] for field in changes}
+        record_insert(ProductSnapshot, {
+            'url_key': url_key,
+            'taken_at': taken_at or datetime.utcnow(),
+            'is_keyframe': is_keyframe,
+            'changes': json.dumps(stored)
+        })
+        cached = [state, 0 if is_keyframe else deltas_since_keyframe + 1]
+
+    with _states_lock:
+        _latest_states[url_key] = cached
+        _latest_states.move_to_end(url_key)
+        while len(_latest_states) > MAX_CACHED_STATES:
+            _latest_states.popitem(last=False)
+    return changes
+
+def forget_latest_states():
+    """
+    Drop every cached latest state, so the next snapshot of each product reloads it
+    Called when this worker loses monitors: another worker appends to their history
+    from then on, and a cached state would diff against stale data if they come back
+    """
+    with _states_lock:
+        _latest_states.clear()
+
+def recent_changes(urls, minutes=60):
+    """
+    Return what changed for each URL in the last `minutes` minutes, without re-scraping
+    Returns dict of snapshot_key(url) -> list of (taken_at, {field: new value}) oldest
+    first, so URLs that normalize to the same product share an entry; the first
+    snapshot of a URL is left out since it isn't a change
+    """
+    changes = {snapshot_key(url): [] for url in urls}
+    if not changes:
+        return changes
+
+    since = datetime.utcnow() - timedelta(minutes=minutes)
+    rows = (db.session.query(ProductSnapshot.url_key, ProductSnapshot.taken_at,
+                             ProductSnapshot.is_keyframe, ProductSnapshot.changes)
+            .filter(ProductSnapshot.url_key.in_(changes.keys()), ProductSnapshot.taken_at >= since)
+            .order_by(ProductSnapshot.taken_at, ProductSnapshot.id)
+            .all())
+    for url_key, taken_at, is_keyframe, stored in rows:
+        stored = json.loads(stored)
+        if is_keyframe:
+            stored = {field: stored[field] for field in stored.pop('_changed', [])}
+        if stored:
+            changes[url_key].append((taken_at, stored))
+    return changes
@@ -104,17 +104,144 @@ document.addEventListener('DOMContentLoaded', function() {
         toggleNotificationInputs();
     }
     
-    // Refresh dashboard every 60 seconds if on dashboard page
-    if (window.location.pathname === '/dashboard' || window.location.pathname === '/') {
+    // Live monitor status on the dashboard page: pushed over /events, with
+    // polling every 30 seconds whenever the stream isn't connected
+    const monitorRows = document.getElementById('monitor-rows');
+    if (monitorRows) {
+        const poller = createStatusPoller(monitorRows);
+        let streaming = false;
+        
+        if (typeof EventSource !== 'undefined') {
+            const stream = new EventSource('/events');
+            stream.addEventListener('open', function() {
+                streaming = true;
+                // Catch up on anything missed while disconnected
+                poller();
+            });
+            stream.addEventListener('error', function() {
+                streaming = false;
+            });
+            stream.addEventListener('status', function(e) {
+                updateMonitorRow(monitorRows, JSON.parse(e.data));
+            });
+            stream.addEventListener('notification', function(e) {
+                showNotificationAlert(JSON.parse(e.data).message);
+            });
+            stream.addEventListener('setup', function(e) {
+                const setup = JSON.parse(e.data);
+                showNotificationAlert(setup.message, setup.ok ? 'success' : 'danger');
+            });
+        }
+        
         setInterval(function() {
-            // Only refresh if user is still on the page
-            if (!document.hidden) {
-                window.location.reload();
+            // Only poll if user is still on the page
+            if (!streaming && !document.hidden) {
+                poller();
             }
-        }, 60000);
+        }, 30000);
     }
 });
 
+// Show a dismissible alert for a notification that was just sent
+function showNotificationAlert(message, category) {
+    const container = document.querySelector('main.container');
+    if (!container) {
+        return;
+    }
+    const alert = document.createElement('div');
+    alert.className = 'alert alert-' + (category || 'success') + ' alert-dismissible fade show';
+    alert.setAttribute('role', 'alert');
+    alert.style.whiteSpace = 'pre-line';
+    alert.textContent = message;
+    const closeButton = document.createElement('button');
+    closeButton.type = 'button';
+    closeButton.className = 'btn-close';
+    closeButton.setAttribute('data-bs-dismiss', 'alert');
+    alert.appendChild(closeButton);
+    container.prepend(alert);
+}
+
+// Fetch monitor status changes and patch them into the dashboard table
+function createStatusPoller(monitorRows) {
+    let cursor = monitorRows.dataset.statusCursor || '';
+    let etag = null;
+    
+    return function() {
+        const headers = {};
+        if (etag) {
+            headers['If-None-Match'] = etag;
+        }
+        const url = '/api/monitors/status' + (cursor ? '?since=' + encodeURIComponent(cursor) : '');
+        fetch(url, {headers: headers, cache: 'no-store', credentials: 'same-origin'})
+            .then(function(response) {
+                if (response.status === 304 || !response.ok) {
+                    return null;
+                }
+                etag = response.headers.get('ETag');
+                return response.json();
+            })
+            .then(function(data) {
+                if (!data) {
+                    return;
+                }
+                data.monitors.forEach(function(monitor) {
+                    updateMonitorRow(monitorRows, monitor);
+                });
+                if (data.cursor) {
+                    cursor = data.cursor;
+                }
+            })
+            .catch(function(error) {
+                console.error('Status update failed:', error);
+            });
+    };
+}
+
+function updateMonitorRow(monitorRows, monitor) {
+    const row = monitorRows.querySelector('tr[data-monitor-id="' + monitor.id + '"]');
+    if (!row) {
+        return;
+    }
+    
+    const setField = function(field, text) {
+        const element = row.querySelector('[data-field="' + field + '"]');
+        if (element && text !== null && text !== undefined) {
+            element.textContent = text;
+        }
+    };
+    setField('last_status', monitor.last_status || 'No status');
+    setField('product_price', monitor.product_price);
+    if (monitor.product_name) {
+        // Details of a monitor that was still being set up have arrived
+        setField('product_name', monitor.product_name);
+        const spinner = row.querySelector('[data-setup-spinner]');
+        if (spinner) {
+            spinner.remove();
+        }
+    }
+    if (monitor.last_checked) {
+        // Same format as the server-rendered 'YYYY-MM-DD HH:MM' (UTC)
+        setField('last_checked', monitor.last_checked.slice(0, 16).replace('T', ' '));
+        row.querySelector('[data-field="last_checked"]').classList.remove('text-muted');
+    }
+    
+    if (!monitor.is_active) {
+        const badge = row.querySelector('[data-field="is_active"]');
+        if (badge) {
+            badge.className = 'badge bg-secondary';
+            badge.textContent = 'Stopped';
+        }
+        const stopButton = row.querySelector('[data-action="stop"]');
+        if (stopButton) {
+            stopButton.remove();
+        }
+        const spinner = row.querySelector('[data-setup-spinner]');
+        if (spinner) {
+            spinner.remove();
+        }
+    }
+}
+
 // Utility functions
 function isValidURL(string) {
     try {
@@ -0,0 +1,236 @@
+import re
+import json
+import html as html_lib
+import logging
+
+# Structured data is pulled straight out of the raw bytes, without building a tree
+JSON_LD_PATTERN = re.compile(
+    rb'<script[^>]*type\s*=\s*["\']?application/ld\+json["\']?[^>]*>(.*?)</script\s*>',
+    re.IGNORECASE | re.DOTALL
+)
+META_TAG_PATTERN = re.compile(rb'<(?:meta|link)\s[^>]*>', re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(rb'([\w:-]+)\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+)')
+
+CURRENCY_SYMBOLS = {
+    'USD': '$',
+    'GBP': '£',
+    'EUR': '€',
+    'JPY': '¥',
+    'CNY': '¥',
+    'INR': '₹'
+}
+
+# schema.org ItemAvailability values (and OpenGraph equivalents) that mean the product can't be bought
+OUT_OF_STOCK_VALUES = {'outofstock', 'soldout', 'discontinued', 'oos', 'out of stock', 'out_of_stock'}
+
+# Fields structured data often leaves out; the HTML extractor fills them in
+OPTIONAL_FIELDS = ['availability', 'sizes', 'delivery']
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _has_type(node, type_name):
+    return any(str(t).rsplit('/', 1)[-1] == type_name for t in _as_list(node.get('@type')))
+
+def _iter_nodes(data):
+    """Yield every JSON object in a JSON-LD document, descending into @graph and lists"""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            yield node
+            if '@graph' in node:
+                stack.append(node['@graph'])
+
+def _load_json_ld(raw):
+    """Parse one JSON-LD script body, tolerating comment/CDATA wrappers"""
+    raw = raw.strip()
+    for wrapper in (b'<!--', b'-->', b'<![CDATA[', b']]>'):
+        raw = raw.replace(wrapper, b'')
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+def _normalize_availability(value):
+    """Map a schema.org/OpenGraph availability value to 'In Stock'/'Out of Stock'"""
+    if not value:
+        return None
+    value = str(value).rsplit('/', 1)[-1].strip().lower()
+    return 'Out of Stock' if value in OUT_OF_STOCK_VALUES else 'In Stock'
+
+def format_price(amount, currency):
+    """Format a structured price the way the HTML extractor reports prices"""
+    try:
+        amount = f"{float(str(amount).replace(',', '')):,.2f}"
+    except ValueError:
+        return None
+    currency = (currency or '').upper()
+    symbol = CURRENCY_SYMBOLS.get(currency)
+    if symbol:
+        return f"{symbol}{amount}"
+    return f"{currency} {amount}" if currency else amount
+
+def _offer_price(offer):
+    """Return (amount, currency) for an Offer or AggregateOffer"""
+    specification = offer.get('priceSpecification')
+    for source in [offer] + [s for s in _as_list(specification) if isinstance(s, dict)]:
+        amount = source.get('price', source.get('lowPrice'))
+        if amount not in (None, ''):
+            return amount, source.get('priceCurrency') or offer.get('priceCurrency')
+    return None, None
+
+def _product_from_json_ld(product):
+    """Pull product fields out of a schema.org Product node"""
+    offers = [o for o in _as_list(product.get('offers')) if isinstance(o, dict)]
+    # AggregateOffer wraps the individual offers
+    for offer in list(offers):
+        offers.extend(o for o in _as_list(offer.get('offers')) if isinstance(o, dict))
+
+    price = None
+    availabilities = []
+    delivery = None
+    for offer in offers:
+        if price is None:
+            amount, currency = _offer_price(offer)
+            if amount is not None:
+                price = format_price(amount, currency)
+        availability = _normalize_availability(offer.get('availability'))
+        if availability:
+            availabilities.append(availability)
+        if delivery is None:
+            delivery = _delivery_from_offer(offer)
+
+    # Sizes are only known when the variants list them; all of them can be out of stock
+    sizes = None
+    for variant in _as_list(product.get('hasVariant')):
+        if not isinstance(variant, dict):
+            continue
+        size = variant.get('size')
+        if isinstance(size, dict):
+            size = size.get('name')
+        if size and sizes is None:
+            sizes = []
+        variant_offers = [o for o in _as_list(variant.get('offers')) if isinstance(o, dict)]
+        variant_availability = [_normalize_availability(o.get('availability')) for o in variant_offers]
+        if variant_availability and 'In Stock' not in variant_availability:
+            continue
+        if size and str(size) not in sizes:
+            sizes.append(str(size))
+
+    availability = None
+    if availabilities:
+        availability = 'In Stock' if 'In Stock' in availabilities else 'Out of Stock'
+
+    name = product.get('name')
+    return {
+        'name': html_lib.unescape(str(name)).strip() if name else None,
+        'price': price,
+        'availability': availability,
+        'sizes': sizes,
+        'delivery': delivery
+    }
+
+def _delivery_from_offer(offer):
+    """Describe schema.org shippingDetails/deliveryLeadTime, if the offer has any"""
+    for details in _as_list(offer.get('shippingDetails')):
+        if not isinstance(details, dict):
+            continue
+        rate = details.get('shippingRate')
+        if isinstance(rate, dict) and str(rate.get('value', '')) in ('0', '0.0', '0.00'):
+            return 'Free delivery available'
+        if details.get('deliveryTime') or rate:
+            return 'Delivery available'
+    if offer.get('deliveryLeadTime'):
+        return 'Delivery available'
+    return None
+
+def _meta_properties(html):
+    """Collect OpenGraph/product meta properties and microdata itemprop attributes"""
+    properties = {}
+    for tag in META_TAG_PATTERN.finditer(html):
+        attrs = {}
+        for key, value in ATTRIBUTE_PATTERN.findall(tag.group()):
+            attrs[key.lower().decode('ascii', 'ignore')] = html_lib.unescape(value.strip(b'"\'').decode('utf-8', 'ignore'))
+        key = attrs.get('property') or attrs.get('itemprop') or attrs.get('name')
+        value = attrs.get('content') or attrs.get('href')
+        if key and value and key.lower() not in properties:
+            properties[key.lower()] = value
+    return properties
+
+def _product_from_meta(properties):
+    """Build product fields from OpenGraph product tags and microdata"""
+    amount = properties.get('product:price:amount') or properties.get('og:price:amount') or properties.get('price')
+    currency = (properties.get('product:price:currency') or properties.get('og:price:currency')
+                or properties.get('pricecurrency'))
+    availability = (properties.get('product:availability') or properties.get('og:availability')
+                    or properties.get('availability'))
+    return {
+        'name': properties.get('og:title'),
+        'price': format_price(amount, currency) if amount else None,
+        'availability': _normalize_availability(availability),
+        'sizes': None,
+        'delivery': None
+    }
+
+def structured_data_cutoff(html, start=0):
+    """
+    Look for a complete structured product in the JSON-LD blocks closed after `start`
+    A product is complete once it states every field, so the HTML after it isn't needed
+    Returns (cut, next_start): cut is the offset just past the block that completed
+    the product (None if not complete yet), next_start is where to resume scanning
+    """
+    next_start = start
+    for match in JSON_LD_PATTERN.finditer(html, start):
+        next_start = match.end()
+        product = extract_structured_product(bytes(html[:match.end()]))
+        if product and not missing_fields(product):
+            return match.end(), next_start
+    return None, next_start
+
+def missing_fields(product):
+    """Return the OPTIONAL_FIELDS a structured product doesn't state"""
+    return [field for field in OPTIONAL_FIELDS if product[field] is None]
+
+def extract_structured_product(html):
+    """
+    Extract product fields from JSON-LD, OpenGraph and microdata meta tags
+    Returns dict with name, price, availability, sizes and delivery, or None when
+    the page has no usable structured product data (at least a name and a price).
+    Availability, sizes and delivery are None when the structured data doesn't state them
+    """
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+
+    try:
+        product = None
+        for match in JSON_LD_PATTERN.finditer(html):
+            data = _load_json_ld(match.group(1))
+            for node in _iter_nodes(data):
+                if _has_type(node, 'Product') or _has_type(node, 'ProductGroup'):
+                    product = _product_from_json_ld(node)
+                    break
+            if product and product['name'] and product['price']:
+                break
+
+        meta = _product_from_meta(_meta_properties(html))
+        if product is None:
+            product = meta
+        else:
+            # Fill gaps in the JSON-LD data from the meta tags
+            for field, value in meta.items():
+                if product.get(field) is None and value is not None:
+                    product[field] = value
+
+        if not product['name'] or not product['price']:
+            return None
+
+        return {field: product[field] for field in ['name', 'price'] + OPTIONAL_FIELDS}
+
+    except Exception as e:
+        logging.debug(f"Structured data extraction failed: {str(e)}")
+        return None